@@ -0,0 +1,141 @@
+"""
+Benchmark of accelerated LR updates: iterations to reach a target MSE.
+
+For each preset, simulated PAX spectra are deconvolved with
+richardson_lucy.lr_fister using the standard update and each accelerated
+update, recording the MSE of the estimate from the ground truth every
+check_every iterations. The target is the lowest MSE the standard update
+reaches within the iterations, relaxed by the tolerance, and the iterations
+each update needs to reach it are compared, together with the time per
+iteration (including the MSE checks). As early stopping is part of the
+regularization, the MSE rises again after its minimum, which the accelerated
+updates pass after fewer iterations, so their iterations must be reduced
+accordingly. Run with e.g.
+
+    python -m benchmarks.acceleration --log10-counts 5 7 --iterations 20000
+"""
+
+import argparse
+import itertools
+import time
+import numpy as np
+
+from benchmarks import hot_paths
+import model_registry
+import pax_simulation_pipeline
+import richardson_lucy
+
+PRESETS = {
+    "schlappa": {
+        "rixs": "schlappa",
+        "photoemission": "ag",
+        "energy_loss": pax_simulation_pipeline.DEFAULT_PARAMETERS["energy_loss"],
+        "regularization_strength": 1e-2,
+    },
+    "doublet": {
+        "rixs": ["i_doublet", 0.045],
+        "photoemission": "fermi",
+        "energy_loss": np.arange(-0.2, 0.4, 0.002),
+        "regularization_strength": 1e-3,
+    },
+}
+
+
+def mse_path(preset, log10_counts, iterations, check_every, acceleration):
+    """Return the checked iterations, the MSEs from the ground truth and the fit time
+    """
+    impulse_response, pax_spectra, xray_xy = model_registry.simulate_from_presets(
+        log10_counts,
+        preset["rixs"],
+        preset["photoemission"],
+        1000,
+        preset["energy_loss"],
+        seed=0,
+    )
+    ground_truth_y = np.asarray(xray_xy["y"])
+    mse = []
+
+    def callback(iteration, estimate, reconstruction):
+        mse.append(np.mean((estimate - ground_truth_y) ** 2))
+
+    start = time.perf_counter()
+    richardson_lucy.lr_fister(
+        np.mean(pax_spectra["y"], axis=0),
+        impulse_response["y"],
+        preset["regularization_strength"],
+        np.abs(pax_spectra["x"][1] - pax_spectra["x"][0]),
+        iterations,
+        callback=callback,
+        callback_every=check_every,
+        acceleration=acceleration,
+    )
+    fit_time = time.perf_counter() - start
+    return np.arange(0, int(iterations), check_every), np.array(mse), fit_time
+
+
+def compare(preset, log10_counts, iterations, check_every, tolerance=0.05):
+    """Return a record per update with the iterations to reach the target MSE
+    """
+    paths = {
+        acceleration: mse_path(
+            preset, log10_counts, iterations, check_every, acceleration
+        )
+        for acceleration in richardson_lucy.ACCELERATIONS
+    }
+    target = (1 + tolerance) * np.amin(paths[None][1])
+    records = []
+    for acceleration, (checked, mse, fit_time) in paths.items():
+        reached = checked[mse <= target]
+        records.append(
+            {
+                "acceleration": acceleration,
+                "target_mse": float(target),
+                "min_mse": float(np.amin(mse)),
+                # None if the target was not reached
+                "iterations_to_target": int(reached[0]) if len(reached) else None,
+                "time_per_iteration": fit_time / int(iterations),
+            }
+        )
+    return records
+
+
+def run(presets, log10_counts_list, iterations, check_every, tolerance=0.05):
+    records = []
+    for name, log10_counts in itertools.product(presets, log10_counts_list):
+        for record in compare(
+            PRESETS[name], log10_counts, iterations, check_every, tolerance
+        ):
+            record.update({"preset": name, "log10_counts": log10_counts})
+            print(
+                f"{name} 1E{log10_counts} {record['acceleration']}: "
+                f"{record['iterations_to_target']} iterations to MSE "
+                f"{record['target_mse']:.3g}, "
+                f"{1e6 * record['time_per_iteration']:.0f} us per iteration"
+            )
+            records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--presets", nargs="+", choices=list(PRESETS), default=list(PRESETS)
+    )
+    parser.add_argument("--log10-counts", nargs="+", type=float, default=[5.0, 7.0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--check-every", type=int, default=1)
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    records = run(
+        args.presets,
+        args.log10_counts,
+        args.iterations,
+        args.check_every,
+        args.tolerance,
+    )
+    print(f"Saved {hot_paths.save(records, args.output, prefix='acceleration')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Benchmarks of the simulation and deconvolution hot paths.
+
+Each benchmark is set up outside of the timed region and then timed over a
+grid of cases (energy-grid size, detected electrons and number of spectra).
+Wall time, CPU time and the peak resident set size of the process are
+measured over the timed calls, and the peak memory traced by tracemalloc over
+a separate call, as tracing slows down allocations. They are written to a JSON
+file so that runs can be compared over time. Run with e.g.
+
+    python -m benchmarks.hot_paths --energy-points 900 1800 --log10-counts 5 7
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+from scipy.optimize import least_squares
+
+from pax_deconvolve.deconvolution import deconvolvers
+from pax_deconvolve.pax_simulations import simulate_pax
+import model_registry
+import pax_simulation_pipeline
+import profiling
+import regularization_search
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+RIXS = "schlappa"
+PHOTOEMISSION = "ag"
+ENERGY_LOSS_RANGE = (-8, 10)
+
+
+def simulate(case):
+    """Full simulation of PAX spectra by pax_deconvolve, without the model registry
+    """
+    energy_loss = _get_energy_loss(case)
+
+    def benchmark():
+        simulate_pax.simulate_from_presets(
+            case["log10_counts"], RIXS, PHOTOEMISSION, case["simulations"], energy_loss,
+        )
+
+    return benchmark
+
+
+def draw_spectra(case):
+    """Drawing PAX spectra from a cached noiseless model
+    """
+    energy_loss = _get_energy_loss(case)
+    model_registry.get_model(RIXS, PHOTOEMISSION, energy_loss)
+
+    def benchmark():
+        model_registry.simulate_from_presets(
+            case["log10_counts"], RIXS, PHOTOEMISSION, case["simulations"], energy_loss,
+        )
+
+    return benchmark
+
+
+def single_deconvolution(case):
+    """A single LRFisterDeconvolve fit
+    """
+    impulse_response, pax_spectra, xray_xy = _simulate(case)
+    deconvolver = deconvolvers.LRFisterDeconvolve(
+        impulse_response["x"],
+        impulse_response["y"],
+        pax_spectra["x"],
+        regularization_strength=0.01,
+        iterations=case["iterations"],
+        ground_truth_y=xray_xy["y"],
+    )
+    return lambda: deconvolver.fit(pax_spectra["y"])
+
+
+def cv_grid(case):
+    """Cross validation over the default grid of regularization strengths
+    """
+    impulse_response, pax_spectra, xray_xy = _simulate(case)
+    parameters = pax_simulation_pipeline.DEFAULT_PARAMETERS
+
+    def benchmark():
+        deconvolver = regularization_search.make_cv_deconvolver(
+            parameters["regularization_search"],
+            impulse_response,
+            pax_spectra["x"],
+            parameters["regularizer_widths"],
+            case["iterations"],
+            xray_xy["y"],
+            parameters["cv_fold"],
+        )
+        deconvolver.fit(pax_spectra["y"])
+
+    return benchmark
+
+
+def bootstraps(case, num_bootstraps=3):
+    """Deconvolutions of bootstrap resamples of the PAX spectra, as in doublet2
+    """
+    impulse_response, pax_spectra, xray_xy = _simulate(case)
+    rng = np.random.default_rng(0)
+
+    def benchmark():
+        for _ in range(num_bootstraps):
+            resampled = rng.choice(len(pax_spectra["y"]), len(pax_spectra["y"]))
+            deconvolver = deconvolvers.LRFisterDeconvolve(
+                impulse_response["x"],
+                impulse_response["y"],
+                pax_spectra["x"],
+                regularization_strength=0.01,
+                iterations=case["iterations"],
+                ground_truth_y=xray_xy["y"],
+            )
+            deconvolver.fit(pax_spectra["y"][resampled])
+
+    return benchmark
+
+
+def dakovski_fit(case, centers=(0, 4, 7, 8, 9, 10, 11, 12)):
+    """Least squares fit of a sum of fixed-center Gaussians, as in dakovski_analysis
+    """
+    impulse_response, pax_spectra, xray_xy = _simulate(case)
+    measured_y = np.mean(pax_spectra["y"], axis=0)
+    energy_loss = _get_energy_loss(case)
+
+    def residual(params):
+        widths, amplitudes = np.reshape(params, (-1, 2)).T
+        deconvolved_y = np.sum(
+            amplitudes[:, None]
+            * np.exp(
+                -((energy_loss - np.array(centers)[:, None]) ** 2)
+                / (widths[:, None] ** 2)
+            ),
+            axis=0,
+        )
+        return (
+            np.convolve(deconvolved_y, impulse_response["y"], mode="valid") - measured_y
+        )
+
+    return lambda: least_squares(residual, [0.1, 0.01] * len(centers), method="lm")
+
+
+def load_result(case):
+    """Loading a stored pipeline result, if one exists for the number of counts
+    """
+    file_name = pax_simulation_pipeline._get_filename(
+        case["log10_counts"], RIXS, PHOTOEMISSION
+    )
+    if not os.path.exists(file_name):
+        return None
+    return lambda: pax_simulation_pipeline.load(
+        case["log10_counts"], RIXS, PHOTOEMISSION
+    )
+
+
+def load_summary(case):
+    """Loading the compact summary of a stored pipeline result, if one exists
+    """
+    if load_result(case) is None:
+        return None
+    return lambda: pax_simulation_pipeline.load_summary(
+        case["log10_counts"], RIXS, PHOTOEMISSION
+    )
+
+
+BENCHMARKS = {
+    "simulate": simulate,
+    "draw_spectra": draw_spectra,
+    "single_deconvolution": single_deconvolution,
+    "cv_grid": cv_grid,
+    "bootstraps": bootstraps,
+    "dakovski_fit": dakovski_fit,
+    "load_result": load_result,
+    "load_summary": load_summary,
+}
+
+
+def measure(benchmark, repeat=3):
+    """Return timings and peak memory of repeated calls of benchmark()
+    """
+    wall_times = []
+    cpu_times = []
+    profiling.reset_peak_rss()
+    for _ in range(repeat):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        benchmark()
+        cpu_times.append(time.process_time() - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+    peak_rss = profiling.peak_rss_kb()
+    tracemalloc.start()
+    benchmark()
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "wall_time_min": min(wall_times),
+        "wall_time_median": float(np.median(wall_times)),
+        "cpu_time_median": float(np.median(cpu_times)),
+        "peak_traced_bytes": peak_traced,
+        # of this process during the timed calls (where VmHWM can be reset),
+        # without joblib workers
+        "peak_rss_kb": peak_rss,
+    }
+
+
+def run(names, cases, repeat=3):
+    """Run the named benchmarks for all cases and return a list of records
+    """
+    records = []
+    for name, case in itertools.product(names, cases):
+        benchmark = BENCHMARKS[name](case)
+        if benchmark is None:
+            print(f"Skipping {name} {case}")
+            continue
+        record = {"benchmark": name, "case": case}
+        record.update(measure(benchmark, repeat))
+        print(f"{name} {case}: {record['wall_time_min']:.3g} s")
+        records.append(record)
+    return records
+
+
+def save(records, file_name=None, prefix="hot_paths"):
+    """Save benchmark records with information on the run to a JSON file
+
+    By default, the file is saved in RESULTS_DIR, named by prefix and the time.
+    """
+    if file_name is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        time_stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_name = os.path.join(RESULTS_DIR, f"{prefix}_{time_stamp}.json")
+    to_save = {
+        "commit": _get_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "records": records,
+    }
+    with open(file_name, "w") as f:
+        json.dump(to_save, f, indent=1)
+    return file_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS)
+    )
+    parser.add_argument("--energy-points", nargs="+", type=int, default=[900])
+    parser.add_argument("--log10-counts", nargs="+", type=float, default=[5.0])
+    parser.add_argument("--simulations", nargs="+", type=int, default=[100])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    cases = [
+        {
+            "energy_points": energy_points,
+            "log10_counts": log10_counts,
+            "simulations": simulations,
+            "iterations": args.iterations,
+        }
+        for energy_points, log10_counts, simulations in itertools.product(
+            args.energy_points, args.log10_counts, args.simulations
+        )
+    ]
+    records = run(args.benchmarks, cases, args.repeat)
+    print(f"Saved {save(records, args.output)}")
+
+
+def _simulate(case):
+    impulse_response, pax_spectra, xray_xy = model_registry.simulate_from_presets(
+        case["log10_counts"],
+        RIXS,
+        PHOTOEMISSION,
+        case["simulations"],
+        _get_energy_loss(case),
+        seed=0,
+    )
+    pax_spectra = {"x": pax_spectra["x"], "y": np.array(pax_spectra["y"])}
+    return impulse_response, pax_spectra, xray_xy
+
+
+def _get_energy_loss(case):
+    return np.linspace(*ENERGY_LOSS_RANGE, case["energy_points"])
+
+
+def _get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    main()
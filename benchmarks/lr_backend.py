@@ -0,0 +1,154 @@
+"""
+Benchmark of the LR update backends: time per iteration of NumPy and Numba.
+
+For each preset, the energy grid of pax_simulation_pipeline.DEFAULT_PARAMETERS
+or of run_simulations/doublet2.py, simulated PAX spectra are deconvolved with
+pax_deconvolve's deconvolvers.LRFisterDeconvolve, which the manuscript uses
+(always in float64), and with richardson_lucy.lr_fister with each backend.
+Each deconvolution is run once before timing, so that compiling the Numba
+kernels is not included. The records hold the time per iteration, the speedup
+over pax_deconvolve and the largest difference of the estimate from
+pax_deconvolve's, relative to its maximum.
+Run with e.g.
+
+    python -m benchmarks.lr_backend --iterations 2000 --repeats 5
+"""
+
+import argparse
+import time
+import numpy as np
+
+from pax_deconvolve.deconvolution import deconvolvers
+
+from benchmarks import hot_paths
+import lr_kernels
+import model_registry
+import pax_simulation_pipeline
+import richardson_lucy
+
+PRESETS = {
+    "schlappa": {
+        "rixs": "schlappa",
+        "photoemission": "ag",
+        "energy_loss": pax_simulation_pipeline.DEFAULT_PARAMETERS["energy_loss"],
+        "regularization_strength": 1e-2,
+    },
+    "doublet2": {
+        "rixs": ["i_doublet", 0.045],
+        "photoemission": "fermi",
+        "energy_loss": np.arange(-0.2, 0.4, 0.002),
+        "regularization_strength": 1e-3,
+    },
+}
+# the deconvolution that the backends are timed and compared against
+_REFERENCE = "pax_deconvolve"
+
+
+def time_backends(preset, log10_counts, iterations, repeats, dtype=np.float64):
+    """Return a record per backend with its best time per iteration over repeats
+
+    The first record is that of pax_deconvolve, the reference of the speedups
+    and differences.
+    """
+    impulse_response, pax_spectra, _ = model_registry.simulate_from_presets(
+        log10_counts,
+        preset["rixs"],
+        preset["photoemission"],
+        1000,
+        preset["energy_loss"],
+        seed=0,
+    )
+
+    def deconvolve(backend, iterations):
+        if backend == _REFERENCE:
+            deconvolver = deconvolvers.LRFisterDeconvolve(
+                impulse_response["x"],
+                impulse_response["y"],
+                pax_spectra["x"],
+                regularization_strength=preset["regularization_strength"],
+                iterations=iterations,
+            )
+            return deconvolver.fit(pax_spectra["y"]).deconvolved_y_
+        return richardson_lucy.lr_fister(
+            np.mean(pax_spectra["y"], axis=0).astype(dtype),
+            np.asarray(impulse_response["y"], dtype=dtype),
+            preset["regularization_strength"],
+            np.abs(pax_spectra["x"][1] - pax_spectra["x"][0]),
+            iterations,
+            backend=backend,
+        )
+
+    records = []
+    for backend in (_REFERENCE,) + tuple(richardson_lucy.BACKENDS):
+        estimate = deconvolve(backend, iterations)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            deconvolve(backend, iterations)
+            times.append(time.perf_counter() - start)
+        if backend == _REFERENCE:
+            reference = np.asarray(estimate, dtype=np.float64)
+        records.append(
+            {
+                "backend": backend,
+                "points": len(estimate),
+                "dtype": np.dtype(np.float64 if backend == _REFERENCE else dtype).name,
+                "time_per_iteration": min(times) / int(iterations),
+                "max_relative_difference": float(
+                    np.amax(np.abs(estimate - reference)) / np.amax(reference)
+                ),
+            }
+        )
+    for record in records:
+        record["speedup"] = (
+            records[0]["time_per_iteration"] / record["time_per_iteration"]
+        )
+    return records
+
+
+def run(presets, log10_counts, iterations, repeats, dtypes=(np.float64,)):
+    if not lr_kernels.AVAILABLE:
+        print("Numba is not installed, the numba backend runs NumPy")
+    records = []
+    for name in presets:
+        for dtype in dtypes:
+            for record in time_backends(
+                PRESETS[name], log10_counts, iterations, repeats, dtype
+            ):
+                record.update({"preset": name, "log10_counts": log10_counts})
+                print(
+                    f"{name} ({record['points']} points, {record['dtype']}) "
+                    f"{record['backend']}: "
+                    f"{1e6 * record['time_per_iteration']:.1f} us per iteration, "
+                    f"{record['speedup']:.2f}x, max relative difference "
+                    f"{record['max_relative_difference']:.1e}"
+                )
+                records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--presets", nargs="+", choices=list(PRESETS), default=list(PRESETS)
+    )
+    parser.add_argument("--log10-counts", type=float, default=7.0)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--dtypes", nargs="+", choices=["float64", "float32"], default=["float64"]
+    )
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    records = run(
+        args.presets,
+        args.log10_counts,
+        args.iterations,
+        args.repeats,
+        [np.dtype(dtype) for dtype in args.dtypes],
+    )
+    print(f"Saved {hot_paths.save(records, args.output, prefix='lr_backend')}")
+
+
+if __name__ == "__main__":
+    main()
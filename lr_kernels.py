@@ -0,0 +1,74 @@
+"""
+Compiled kernels for the element-wise steps of the LR Fister update, with Numba.
+
+Apart from its FFTs, every LR iteration is a handful of NumPy calls on arrays
+of a few thousand points, each of which allocates a temporary. update fuses
+the steps after the adjoint FFT, applying the LR factor to the estimate and
+smoothing it with the regularization kernel, into loops that write into
+buffers the caller allocates once. It is used by richardson_lucy.lr_fister
+with backend="numba". Numba is optional: AVAILABLE is False if it is not
+installed, and lr_fister then falls back to NumPy.
+
+The kernel works on 2D arrays with one spectrum per row.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+AVAILABLE = numba is not None
+
+
+def _update(estimate, adjoint, normalization, smoothing_kernel, work, out):
+    # work holds the updated estimate between half_width zeros on both sides,
+    # so that the smoothing loop needs no bounds checks
+    width = len(smoothing_kernel)
+    half_width = width // 2
+    length = out.shape[1]
+    for row in range(out.shape[0]):
+        for k in range(length):
+            work[half_width + k] = estimate[row, k] * (
+                adjoint[row, k] / normalization[k]
+            )
+        # convolution with the (symmetric) smoothing kernel, with zeros
+        # outside of the spectrum like convolve1d(mode="constant")
+        for k in range(length):
+            total = work.dtype.type(0)
+            for j in range(width):
+                total += smoothing_kernel[j] * work[k + j]
+            out[row, k] = total
+
+
+if AVAILABLE:
+    _update = numba.njit(cache=True, fastmath={"reassoc", "contract"})(_update)
+
+
+def update(estimate, adjoint, normalization, smoothing_kernel, work, out):
+    """Write the smoothed LR update of estimate to out and return it
+
+    The estimate is multiplied by adjoint / normalization and then convolved
+    with smoothing_kernel. work is a buffer from work_buffer, which can be
+    reused across calls.
+    """
+    _update(
+        _as_rows(estimate),
+        _as_rows(adjoint),
+        normalization,
+        smoothing_kernel,
+        work,
+        _as_rows(out),
+    )
+    return out
+
+
+def work_buffer(length, smoothing_kernel, dtype):
+    """Return the work buffer of update for spectra of length points
+    """
+    return np.zeros(length + 2 * (len(smoothing_kernel) // 2), dtype)
+
+
+def _as_rows(y):
+    return np.reshape(y, (-1, np.shape(y)[-1]))
@@ -3,23 +3,36 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
-import traceback
-from tensorboard.backend.event_processing.event_accumulator import EventAccumulator
-import pickle
 
 from manuscript_plots import set_plot_params
 
 set_plot_params.init_paper_small()
-from pax_deconvolve.pax_simulations import simulate_pax
-from pax_deconvolve.deconvolution import assess_convergence
+from pax_deconvolve.deconvolution import deconvolvers
+import model_registry
+import metrics_recorder
+import richardson_lucy
 
 FIGURES_DIR = "figures"
+CONVERGENCE_FILE = "data/convergence.npz"
 REGULARIZATION_PARAMETERS = [0.0028, 0.0129, 0.1]  # regularization parameters to plot
+RECORD_EVERY = 1  # record convergence metrics every this many iterations
+# largest difference between the richardson_lucy and pax_deconvolve
+# deconvolutions, relative to the max of the latter, for the metrics to hold
+# for the deconvolutions of the manuscript
+AGREEMENT_TOLERANCE = 1e-3
 
 
 def run_ana():
     """Run analysis to create data used in this plot
+
+    The metrics are recorded while iterating richardson_lucy.lr_fister, which
+    pax_deconvolve's deconvolver does not allow. To check that they describe
+    the pax_deconvolve deconvolutions used in the manuscript, the same
+    training spectra are also deconvolved with deconvolvers.LRFisterDeconvolve
+    and the largest difference between the results is saved with the metrics.
+    The figure is only made if it is within AGREEMENT_TOLERANCE (see also
+    tests/test_richardson_lucy.py, which pins the agreement of the two
+    implementations).
     """
     log10_num_electrons = 4.0
     rixs_model = "schlappa"
@@ -28,64 +41,113 @@ def run_ana():
     energy_loss = np.arange(-8, 10, 0.01)
     regularization_strengths = np.logspace(-3, -1, 10)
     iterations = 1000
-    impulse_response, pax_spectra, xray_xy = simulate_pax.simulate_from_presets(
-        log10_num_electrons,
+    # half of the spectra are used for training, the other half, from the
+    # cached validation set, for validation
+    num_training = num_simulations // 2
+    log10_training_electrons = log10_num_electrons + np.log10(
+        num_training / num_simulations
+    )
+    impulse_response, pax_spectra, xray_xy = model_registry.simulate_from_presets(
+        log10_training_electrons,
         rixs_model,
         photoemission_model,
-        num_simulations,
+        num_training,
         energy_loss,
     )
-    assess_convergence.run(
-        impulse_response, pax_spectra, xray_xy, regularization_strengths, iterations
-    )
+    train_y = np.mean(pax_spectra["y"], axis=0)
+    val_y = model_registry.validation_spectrum(
+        log10_training_electrons,
+        rixs_model,
+        photoemission_model,
+        num_training,
+        energy_loss,
+    )["y"]
+    energy_spacing = np.abs(np.mean(np.diff(impulse_response["x"])))
+    to_save = {"regularization_strengths": regularization_strengths}
+    differences = []
+    for ind, regularization_strength in enumerate(regularization_strengths):
+        recorder = metrics_recorder.MetricsRecorder(
+            ["deconvolved_mse", "validation_mse"],
+            iterations // RECORD_EVERY + 1,
+            RECORD_EVERY,
+        )
+        deconvolved_y = richardson_lucy.lr_fister(
+            train_y,
+            impulse_response["y"],
+            regularization_strength,
+            energy_spacing,
+            iterations,
+            callback=metrics_recorder.deconvolution_mse_callback(
+                recorder, xray_xy["y"], val_y
+            ),
+            callback_every=recorder.every,
+        )
+        to_save[f"metrics_{ind}"] = recorder.to_array()
+        deconvolver = deconvolvers.LRFisterDeconvolve(
+            impulse_response["x"],
+            impulse_response["y"],
+            pax_spectra["x"],
+            regularization_strength=regularization_strength,
+            iterations=iterations,
+            ground_truth_y=xray_xy["y"],
+        )
+        deconvolver.fit(pax_spectra["y"])
+        differences.append(
+            np.amax(np.abs(deconvolved_y - deconvolver.deconvolved_y_))
+            / np.amax(deconvolver.deconvolved_y_)
+        )
+    to_save["pax_deconvolve_difference"] = np.array(differences)
+    np.savez(CONVERGENCE_FILE, **to_save)
 
 
 def make_figure():
     _, axs = plt.subplots(2, 1, sharex=True, figsize=(3.37, 3.5))
-    deconvolved_list = _load_deconvolved_mse()
-    _make_deconvolved_mse_plot(axs[0], deconvolved_list)
-    val_list = _load_val_mse()
-    _make_val_mse_plot(axs[1], val_list)
+    metrics_list = _load_metrics()
+    _make_deconvolved_mse_plot(axs[0], metrics_list)
+    _make_val_mse_plot(axs[1], metrics_list)
     _format_figure(axs)
     file_name = f"{FIGURES_DIR}/convergence.eps"
     plt.savefig(file_name, dpi=600)
 
 
-def _load_deconvolved_mse():
-    data_list = []
-    for par in REGULARIZATION_PARAMETERS:
-        file_name = f"data/convergence_deconvolved/run-{str(par)}.csv"
-        data = np.genfromtxt(file_name, skip_header=1, delimiter=",")
-        data_list.append(data)
-    return data_list
-
-
-def _load_val_mse():
-    data_list = []
+def _load_metrics():
+    """Load recorded metrics for the regularization strengths closest to those to plot
+    """
+    data = np.load(CONVERGENCE_FILE)
+    regularization_strengths = data["regularization_strengths"]
+    difference = np.amax(data["pax_deconvolve_difference"])
+    if difference > AGREEMENT_TOLERANCE:
+        raise ValueError(
+            f"The recorded deconvolutions differ from pax_deconvolve's by "
+            f"{difference:.1e} of their max, more than {AGREEMENT_TOLERANCE}, "
+            "so their metrics do not describe the manuscript's deconvolutions"
+        )
+    metrics_list = []
     for par in REGULARIZATION_PARAMETERS:
-        file_name = f"data/convergence_validation_reconstruction/run-{str(par)}.csv"
-        data = np.genfromtxt(file_name, skip_header=1, delimiter=",")
-        data_list.append(data)
-    return data_list
+        ind = np.argmin(np.abs(np.log(regularization_strengths / par)))
+        metrics_list.append(data[f"metrics_{ind}"])
+    return metrics_list
 
 
-def _make_deconvolved_mse_plot(ax, data_list):
-    for ind, data in enumerate(data_list):
+def _make_deconvolved_mse_plot(ax, metrics_list):
+    for ind, metrics in enumerate(metrics_list):
         ax.loglog(
-            data[:, 1], data[:, 2], label=str(1000 * REGULARIZATION_PARAMETERS[ind])
+            metrics["iteration"],
+            metrics["deconvolved_mse"],
+            label=str(1000 * REGULARIZATION_PARAMETERS[ind]),
         )
 
 
-def _make_val_mse_plot(ax, data_list):
+def _make_val_mse_plot(ax, metrics_list):
     min_list = []
-    for data in data_list:
-        minimum = np.amin(data[:, 2])
+    for metrics in metrics_list:
+        minimum = np.amin(metrics["validation_mse"])
         min_list.append(minimum)
     minimum = np.amin(min_list)
-    for ind, data in enumerate(data_list):
+    for ind, metrics in enumerate(metrics_list):
         ax.loglog(
-            data[:, 1],
-            data[:, 2] - minimum + 10 ** (-2),
+            metrics["iteration"],
+            metrics["validation_mse"] - minimum + 10 ** (-2),
             label=str(REGULARIZATION_PARAMETERS[ind]),
         )
     ax.axvline(18 * 4, color="k", linestyle="--")
@@ -12,10 +12,12 @@ Phys. Rev. A Volume 6, Number 1 p. 94-104 (1972)
 @author: dhigley
 """
 
+import functools
+import os
 import numpy as np
 import matplotlib.pyplot as plt
 
-files_start = "/Users/dhigley/Documents/pax_simulations_manuscript/manuscript_plots/conversion_efficiency/"
+TABLES_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # binding energies taken from CXRO:
 ag_3d_3half_binding = 374.0
@@ -27,16 +29,17 @@ al_2p_3half_binding = 72.55
 # Pt Fermi taken as Pt 5d value
 pt_fermi_binding = 11.4
 
-# Photoionization cross sections from Yeh and Lindau (in Mb, 10^(-22) m^2 = 10^(-18) cm^2):
-ag_3d_data = np.genfromtxt("".join([files_start, "ag_3d_cross_sections.txt"]))
-ag_3d_cross_section = {"x": ag_3d_data[:, 0], "y": ag_3d_data[:, 1]}
-au_4f_data = np.genfromtxt("".join([files_start, "au_4f_cross_sections.txt"]))
-au_4f_cross_section = {"x": au_4f_data[:, 0], "y": au_4f_data[:, 1]}
-al_2p_data = np.genfromtxt("".join([files_start, "al_2p_cross_sections.txt"]))
-al_2p_cross_section = {"x": al_2p_data[:, 0], "y": al_2p_data[:, 1]}
-# (use Pt 5d cross section)
-pt_5d_data = np.genfromtxt("".join([files_start, "pt_5d_cross_sections.txt"]))
-pt_fermi_cross_section = {"x": pt_5d_data[:, 0], "y": pt_5d_data[:, 1]}
+# Photoionization cross sections from Yeh and Lindau (in Mb, 10^(-22) m^2 = 10^(-18) cm^2)
+# are in the tables <name>_cross_sections.txt, which are loaded on first use by
+# load_cross_section. The old module-level dictionaries are still available
+# under these names:
+_CROSS_SECTION_NAMES = {
+    "ag_3d_cross_section": "ag_3d",
+    "au_4f_cross_section": "au_4f",
+    "al_2p_cross_section": "al_2p",
+    # (use Pt 5d cross section)
+    "pt_fermi_cross_section": "pt_5d",
+}
 # IMFPs are in nm
 # IMFP for Ag and Au from S. Tanuma et al.,
 # "Experimental determinations of electron inelastic mean free paths in
@@ -313,47 +316,48 @@ ag_atomic_density = avogadro_number * ag_density / ag_molar_mass
 au_atomic_density = avogadro_number * au_density / au_molar_mass
 pt_atomic_density = avogadro_number * pt_density / pt_molar_mass
 
+# Converter materials, with arguments for calculate_conversion_efficiency
+# (cross sections are given as names of cross section tables)
+MATERIALS = {
+    "Ag 3d": {
+        "cross_section": "ag_3d",
+        "imfp": ag_imfp,
+        "binding_energy": ag_3d_5half_binding,
+        "number_density": ag_atomic_density,
+    },
+    "Au 4f": {
+        "cross_section": "au_4f",
+        "imfp": au_imfp,
+        "binding_energy": au_4f_7half_binding,
+        "number_density": au_atomic_density,
+    },
+    "Al 2p": {
+        "cross_section": "al_2p",
+        "imfp": al_imfp,
+        "binding_energy": al_2p_3half_binding,
+        "number_density": al_atomic_density,
+    },
+    "Pt Fermi": {
+        "cross_section": "pt_5d",
+        "imfp": pt_imfp,
+        "binding_energy": pt_fermi_binding,
+        "number_density": pt_atomic_density,
+    },
+}
+
 
 def conversion_plot():
-    phot = np.linspace(500, 1500, 1000)
-    ag_conversion_efficiency = {
-        "x": phot,
-        "y": calculate_conversion_efficiency(
-            phot, ag_3d_cross_section, ag_imfp, ag_3d_5half_binding, ag_atomic_density
-        ),
-    }
     phot = np.linspace(200, 1500, 1000)
-    au_conversion_efficiency = {
-        "x": phot,
-        "y": calculate_conversion_efficiency(
-            phot, au_4f_cross_section, au_imfp, au_4f_7half_binding, au_atomic_density
-        ),
-    }
-    al_conversion_efficiency = {
-        "x": phot,
-        "y": calculate_conversion_efficiency(
-            phot, al_2p_cross_section, al_imfp, al_2p_3half_binding, al_atomic_density
-        ),
-    }
-    pt_conversion_efficiency = {
-        "x": phot,
-        "y": calculate_conversion_efficiency(
-            phot, pt_fermi_cross_section, pt_imfp, pt_fermi_binding, pt_atomic_density
-        ),
-    }
+    efficiencies = conversion_efficiency_map(phot)
+    # Ag 3d cross sections are only shown from 500 eV
+    ag_phot = np.linspace(500, 1500, 1000)
+    ag_efficiency = calculate_conversion_efficiency(ag_phot, **MATERIALS["Ag 3d"])
     plt.figure(figsize=(3.37, 3.5))
-    plt.semilogy(
-        ag_conversion_efficiency["x"], ag_conversion_efficiency["y"], label="Ag 3d"
-    )
-    plt.semilogy(
-        au_conversion_efficiency["x"], au_conversion_efficiency["y"], label="Au 4f"
-    )
-    plt.semilogy(
-        al_conversion_efficiency["x"], al_conversion_efficiency["y"], label="Al 2p"
-    )
-    plt.semilogy(
-        pt_conversion_efficiency["x"], pt_conversion_efficiency["y"], label="Pt Fermi"
-    )
+    for material, efficiency in zip(MATERIALS, efficiencies):
+        if material == "Ag 3d":
+            plt.semilogy(ag_phot, ag_efficiency, label=material)
+        else:
+            plt.semilogy(phot, efficiency, label=material)
     plt.legend(loc="center right")
     plt.xlabel("Photon Energy (eV)")
     plt.ylabel("Conversion Efficiency\n(Electrons per Photon)")
@@ -365,10 +369,93 @@ def conversion_plot():
 def calculate_conversion_efficiency(
     phot, cross_section, imfp, binding_energy, number_density
 ):
+    """Return conversion efficiency in electrons per photon
+
+    cross_section is either a dictionary of cross sections or the name of a
+    cross section table.
+    """
     kinetic_energy = phot - binding_energy
-    cross_interp = np.interp(phot, cross_section["x"], cross_section["y"])
+    cross_interp = _interpolate_cross_section(phot, cross_section)
     imfp_interp = np.interp(kinetic_energy, imfp["x"], imfp["y"])
     conversion_efficiency = (
         number_density * (cross_interp * 1e-18) * (imfp_interp / 1e7)
     )
     return conversion_efficiency
+
+
+def conversion_efficiency_map(phot, materials=None, thickness=np.inf, angle=0.0):
+    """Return conversion efficiencies of several converters in one call
+
+    phot (eV), thickness (converter thickness in nm) and angle (between the
+    detected electrons and the surface normal in degrees) are broadcast
+    against each other. The result has an additional first axis over
+    materials (names in MATERIALS, all of them by default). For the default
+    infinitely thick converter viewed along the normal, this is the same as
+    calculate_conversion_efficiency.
+    """
+    if materials is None:
+        materials = list(MATERIALS)
+    phot = np.asarray(phot, dtype=float)
+    cos_angle = np.cos(np.radians(angle))
+    efficiencies = []
+    for material in materials:
+        parameters = MATERIALS[material]
+        kinetic_energy = phot - parameters["binding_energy"]
+        cross_interp = _interpolate_cross_section(phot, parameters["cross_section"])
+        imfp_interp = np.interp(
+            kinetic_energy, parameters["imfp"]["x"], parameters["imfp"]["y"]
+        )
+        # electrons escape from within about an IMFP along their exit direction
+        escape_depth = imfp_interp * cos_angle
+        efficiency = (
+            parameters["number_density"]
+            * (cross_interp * 1e-18)
+            * (escape_depth / 1e7)
+            * -np.expm1(-thickness / escape_depth)
+        )
+        efficiencies.append(efficiency)
+    return np.stack(np.broadcast_arrays(*efficiencies))
+
+
+@functools.lru_cache(maxsize=None)
+def load_cross_section(name):
+    """Return the cross section table <name>_cross_sections.txt
+
+    The text table is parsed once and then cached next to it as a binary .npy
+    file, which is used on later loads while it is newer than the text table.
+    """
+    text_file = os.path.join(TABLES_DIR, f"{name}_cross_sections.txt")
+    binary_file = os.path.join(TABLES_DIR, f"{name}_cross_sections.npy")
+    if os.path.exists(binary_file) and (
+        os.path.getmtime(binary_file) >= os.path.getmtime(text_file)
+    ):
+        data = np.load(binary_file)
+    else:
+        data = np.genfromtxt(text_file)[:, :2]
+        try:
+            np.save(binary_file, data)
+        except OSError:
+            # read-only installation, parse the text table again next time
+            pass
+    return {"x": data[:, 0], "y": data[:, 1]}
+
+
+@functools.lru_cache(maxsize=None)
+def cross_section_interpolator(name):
+    """Return a function interpolating the cross section table name at given photon energies
+    """
+    cross_section = load_cross_section(name)
+    return functools.partial(np.interp, xp=cross_section["x"], fp=cross_section["y"])
+
+
+def _interpolate_cross_section(phot, cross_section):
+    if isinstance(cross_section, str):
+        return cross_section_interpolator(cross_section)(phot)
+    return np.interp(phot, cross_section["x"], cross_section["y"])
+
+
+def __getattr__(name):
+    # load cross section dictionaries of the old module-level names on first access
+    if name in _CROSS_SECTION_NAMES:
+        return load_cross_section(_CROSS_SECTION_NAMES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -19,12 +19,12 @@ KE_SHIFT = 0.6
 
 
 def load_data():
-    data = doublet2.load()
+    data = doublet2.load_summary()
     return data
 
 
 def doublet_performance2():
-    data = doublet2.load()
+    data = doublet2.load_summary()
     f = plt.figure(figsize=(3.37, 4.5))
     grid = plt.GridSpec(3, 2)
     ax_irf = f.add_subplot(grid[0, :])
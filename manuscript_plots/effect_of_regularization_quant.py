@@ -6,7 +6,7 @@ import matplotlib.pyplot as plt
 import datetime
 import pickle
 
-from pax_deconvolve.pax_simulations import simulate_pax
+import model_registry
 import pax_simulation_pipeline
 from manuscript_plots import set_plot_params
 
@@ -45,14 +45,14 @@ def make_figure():
 
 
 def _make_example_pax_val_data():
-    _, example_spectra, _ = simulate_pax.simulate_from_presets(
+    val_spectrum = model_registry.validation_spectrum(
         5.0,
         "schlappa",
         "ag",
         1000,
         schlappa_performance.SCHLAPPA_PARAMETERS["energy_loss"],
     )
-    return np.mean(example_spectra["y"], axis=0)
+    return val_spectrum["y"]
 
 
 def _load_data():
@@ -161,21 +161,31 @@ def _reconvolved_mse_plot(ax, deconvolved_list, deconvolved_labels, norm):
 
 def _cv_plot(ax, deconvolved_list, deconvolved_labels, norm):
     for deconvolved, deconvolved_label in zip(deconvolved_list, deconvolved_labels):
-        cv_rmse = np.sqrt(deconvolved.cv_) / norm
+        regularizer_widths, cv = _get_cv_curve(deconvolved)
+        cv_rmse = np.sqrt(cv) / norm
         line = ax.loglog(
-            deconvolved.regularizer_widths[START_REG:],
-            cv_rmse[START_REG:] - np.amin(cv_rmse[START_REG:]) + 1e-6,
+            regularizer_widths,
+            cv_rmse - np.amin(cv_rmse) + 1e-6,
             label=deconvolved_label,
         )
-        min_ind = np.argmin(deconvolved.cv_[START_REG:])
+        min_ind = np.argmin(cv)
         ax.loglog(
-            deconvolved.regularizer_widths[START_REG:][min_ind],
-            cv_rmse[START_REG:][min_ind] - np.amin(cv_rmse[START_REG:]) + 1e-6,
+            regularizer_widths[min_ind],
+            cv_rmse[min_ind] - np.amin(cv_rmse) + 1e-6,
             marker="x",
             color=line[0].get_color(),
         )
 
 
+def _get_cv_curve(deconvolved):
+    """Return evaluated regularization strengths and their cross validation MSEs
+    """
+    if hasattr(deconvolved, "regularization_strengths_"):
+        # adaptive searches only evaluate strengths within their search range
+        return deconvolved.regularization_strengths_, deconvolved.cv_
+    return deconvolved.regularizer_widths[START_REG:], deconvolved.cv_[START_REG:]
+
+
 def _format_figure(axs):
     axs[1, 0].set_xlim((396, 414))
     axs[2, 0].set_xlim((396, 414))
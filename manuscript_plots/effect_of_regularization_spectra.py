@@ -6,64 +6,66 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import pickle
-from joblib import Parallel, delayed
 
 from manuscript_plots import set_plot_params
 
 set_plot_params.init_paper_small()
 import pax_simulation_pipeline
-from pax_deconvolve.pax_simulations import simulate_pax
-import LRDeconvolve
+import model_registry
+import sweep
+from pax_deconvolve.deconvolution import deconvolvers
 
-START_REGULARIZER = 0
+RESULTS_DIR = "old_simulated_results/effect_of_regularization_spectra"
+LOG10_ELECTRONS = [4, 7]
+REGULARIZERS_TO_PLOT = [2, 5, 9]  # indices of regularizer widths to plot
 
 
 def run_sim():
-    results_4 = _run_deconvolution_set(4)
-    results_7 = _run_deconvolution_set(7)
-    results = {"4": results_4, "7": results_7}
-    file_name = "old_simulated_results/test.pickle"
-    with open(file_name, "wb") as f:
-        pickle.dump(results, f)
+    regularizer_widths = pax_simulation_pipeline.DEFAULT_PARAMETERS[
+        "regularizer_widths"
+    ]
+    units = [
+        {"log10_num_electrons": log10_num_electrons, "regularizer_index": ind}
+        for log10_num_electrons in LOG10_ELECTRONS
+        for ind in range(len(regularizer_widths))
+    ]
+    sweep.run_sweep(_run_single_deconvolution, units, sweep.ResultStore(RESULTS_DIR))
+
+
+def load_sim(regularizer_indices=REGULARIZERS_TO_PLOT):
+    """Load deconvolutions with the given regularizer indices for each number of electrons
+    """
+    store = sweep.ResultStore(RESULTS_DIR)
+    results = {}
+    for log10_num_electrons in LOG10_ELECTRONS:
+        results[str(log10_num_electrons)] = [
+            store.load(
+                sweep.unit_key(
+                    {"log10_num_electrons": log10_num_electrons, "regularizer_index": i}
+                )
+            )
+            for i in regularizer_indices
+        ]
+    return results
 
 
-def _run_deconvolution_set(log10_num_electrons):
+def _run_single_deconvolution(log10_num_electrons, regularizer_index):
     parameters = pax_simulation_pipeline.DEFAULT_PARAMETERS
-    impulse_response, pax_spectra, xray_xy = simulate_pax.simulate_from_presets(
+    # seeding by the number of electrons gives all regularizers the same data
+    impulse_response, pax_spectra, xray_xy = model_registry.simulate_from_presets(
         log10_num_electrons,
         "schlappa",
         "ag",
         parameters["simulations"],
         parameters["energy_loss"],
+        seed=log10_num_electrons,
     )
-    regularizer_widths = parameters["regularizer_widths"]
-    iterations = 1e5
-    results = Parallel(n_jobs=-1)(
-        delayed(_run_single_deconvolution)(
-            impulse_response, pax_spectra, xray_xy, regularizer_width, iterations
-        )
-        for regularizer_width in regularizer_widths
-    )
-    return results
-
-
-def load_sim():
-    file_name = "old_simulated_results/test.pickle"
-    with open(file_name, "rb") as f:
-        results = pickle.load(f)
-    return results
-
-
-def _run_single_deconvolution(
-    impulse_response, pax_spectra, xray_xy, regularizer_width, iterations
-):
-    deconvolver = LRDeconvolve.LRFisterDeconvolve(
+    deconvolver = deconvolvers.LRFisterDeconvolve(
         impulse_response["x"],
         impulse_response["y"],
         pax_spectra["x"],
-        regularizer_width=regularizer_width,
-        iterations=iterations,
+        regularization_strength=parameters["regularizer_widths"][regularizer_index],
+        iterations=1e5,
         ground_truth_y=xray_xy["y"],
     )
     deconvolver.fit(np.array(pax_spectra["y"]))
@@ -73,10 +75,8 @@ def _run_single_deconvolution(
 def make_figure():
     results = load_sim()
     f, axs = plt.subplots(1, 2, sharex=True, sharey=True, figsize=(3.37, 3.75))
-    to_plot_4 = list(results["4"][i] for i in [2, 5, 9])
-    to_plot_7 = list(results["7"][i] for i in [2, 5, 9])
-    _regularization_offset_plot(axs[0], to_plot_4)
-    _regularization_offset_plot(axs[1], to_plot_7)
+    _regularization_offset_plot(axs[0], results["4"])
+    _regularization_offset_plot(axs[1], results["7"])
     _format_figure(f, axs)
     plt.savefig("figures/effect_of_regularization_spectra.eps", dpi=600)
 
@@ -111,7 +111,7 @@ def _format_figure(f, axs):
     regularizer_widths = pax_simulation_pipeline.DEFAULT_PARAMETERS[
         "regularizer_widths"
     ]
-    regularizers_to_plot = list(regularizer_widths[i] for i in [2, 5, 9])
+    regularizers_to_plot = list(regularizer_widths[i] for i in REGULARIZERS_TO_PLOT)
     regularizer_labels = [
         r"$\sigma = " + str(round(regularizers_to_plot[0] * 1e3, 1)) + "$ meV",
         r"$\sigma = " + str(round(regularizers_to_plot[1] * 1e3, 1)) + "$ meV",
@@ -11,11 +11,18 @@ from manuscript_plots import set_plot_params
 
 from pax_deconvolve.deconvolution import deconvolvers
 from pax_deconvolve import visualize
+import regularization_search
 
 set_plot_params.init_paper_small()
 
 PHOTON_ENERGY_OFFSET = 804.23-23.8    # (eV) (determined empirically)
 KE_OFFSET = 12.66    # (eV) (determine empirically)
+ACCELERATION = None    # or "nesterov"/"biggs_andrews" (see richardson_lucy)
+# 0 convolves the flat background that extends the PSF as constants:
+TAIL_TOLERANCE = None
+# only used with ACCELERATION or TAIL_TOLERANCE, pax_deconvolve otherwise
+# runs with its own default:
+ITERATIONS = 1e3
 
 def lcls_figure():
     specs = pax_lcls2016.get_lcls_specs()
@@ -110,23 +117,48 @@ def _format_figure(ax_irf, ax_pax, ax_spectra, specs):
 def _deconvolve_spectra(specs, regularization_strength):
     deconvolver_list = []
     for ind, spec in enumerate(specs['spectra']):
-        deconvolver = deconvolvers.LRFisterDeconvolve(
-            specs['psf']['x'],
-            specs['psf']['y']/np.sum(specs['psf']['y']),
-            specs['spectra'][ind]['x'],
-            regularization_strength=regularization_strength
-        )
+        if ACCELERATION is None and TAIL_TOLERANCE is None:
+            deconvolver = deconvolvers.LRFisterDeconvolve(
+                specs['psf']['x'],
+                specs['psf']['y']/np.sum(specs['psf']['y']),
+                specs['spectra'][ind]['x'],
+                regularization_strength=regularization_strength
+            )
+        else:
+            deconvolver = regularization_search.make_deconvolver(
+                specs['psf']['x'],
+                specs['psf']['y']/np.sum(specs['psf']['y']),
+                specs['spectra'][ind]['x'],
+                regularization_strength,
+                ITERATIONS,
+                None,
+                acceleration=ACCELERATION,
+                tail_tolerance=TAIL_TOLERANCE
+            )
         measured_y = np.array([spec['y']])
         _ = deconvolver.fit(measured_y)
         deconvolver_list.append(deconvolver)
     return deconvolver_list
 
 def _estimate_best_regularization_strength(specs):
-    deconvolver = deconvolvers.LRFisterGrid(
+    if ACCELERATION is None and TAIL_TOLERANCE is None:
+        grid = deconvolvers.LRFisterGrid
+        kwargs = {}
+    else:
+        # the grid search of pax_deconvolve only runs the standard update
+        # with the full PSF
+        grid = regularization_search.BatchedLRFisterGrid
+        kwargs = {
+            'iterations': ITERATIONS,
+            'acceleration': ACCELERATION,
+            'tail_tolerance': TAIL_TOLERANCE
+        }
+    deconvolver = grid(
         specs['psf']['x'],
         specs['psf']['y']/np.sum(specs['psf']['y']),
         specs['spectra'][0]['x'],
-        cv_folds=2
+        cv_folds=2,
+        **kwargs
     )
     to_fit = np.array([specs['spectra'][6]['y'], specs['spectra'][7]['y']])
     _ = deconvolver.fit(to_fit)
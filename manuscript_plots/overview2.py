@@ -7,7 +7,8 @@ import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 import matplotlib.patheffects as PathEffects
 
-from pax_deconvolve.pax_simulations import model_photoemission, model_rixs, simulate_pax
+from pax_deconvolve.pax_simulations import model_photoemission, model_rixs
+import model_registry
 from manuscript_plots import set_plot_params
 
 set_plot_params.init_paper_small()
@@ -107,12 +108,10 @@ def _simulate_data():
     fermi_photoemission = model_photoemission.make_model_photoemission(
         "fermi", schlappa_rixs, schlappa_rixs["x"][1] - schlappa_rixs["x"][0]
     )
-    _, pax_spectra = simulate_pax.simulate(schlappa_rixs, ag_photoemission, 1e10, 1)
-    pax_spectrum = {"x": pax_spectra["x"], "y": pax_spectra["y"][0]}
-    _, fermi_pax_spectra = simulate_pax.simulate(
-        schlappa_rixs, fermi_photoemission, 1e10, 1
+    pax_spectrum = model_registry.expected_pax_spectrum(schlappa_rixs, ag_photoemission)
+    fermi_pax_spectrum = model_registry.expected_pax_spectrum(
+        schlappa_rixs, fermi_photoemission
     )
-    fermi_pax_spectrum = {"x": fermi_pax_spectra["x"], "y": fermi_pax_spectra["y"][0]}
     return (
         schlappa_rixs,
         ag_photoemission,
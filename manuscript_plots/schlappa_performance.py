@@ -16,27 +16,21 @@ FIGURES_DIR = "figures"
 # List of base 10 logarithm of detected electrons to simulate:
 LOG10_COUNTS_LIST = [7.0, 6.5, 6.0, 5.5, 5.0, 4.5, 4.0, 3.5, 3.0, 2.5]
 
-# Below are the parameters to run the simulations with
-SCHLAPPA_PARAMETERS = {
-    "energy_loss": np.arange(-8, 10, 0.01),
-    "iterations": int(1e5),
-    "simulations": 1000,
-    "cv_fold": 3,
-    "regularizer_widths": np.logspace(-3, -1, 10),
-}
+# Below are the parameters to run the simulations with (the pipeline defaults,
+# overridden per sweep in sweeps/schlappa_ag.toml)
+SCHLAPPA_PARAMETERS = dict(
+    pax_simulation_pipeline.DEFAULT_PARAMETERS, iterations=int(1e5)
+)
 
 # shift to apply to kinetic energies to correct for incorrectly defined IRF
 #   x-values in original simulations
 KE_SHIFT = 18
 
 def _load_data(log10_counts_to_load):
-    data_list = []
-    num_counts = []
-    for i in log10_counts_to_load:
-        data_list.append(
-            pax_simulation_pipeline.load(i, rixs="schlappa", photoemission="ag")
-        )
-        num_counts.append(10 ** i)
+    data_list = pax_simulation_pipeline.load_sweep_summaries(
+        log10_counts_to_load, rixs="schlappa", photoemission="ag"
+    )
+    num_counts = [10 ** i for i in log10_counts_to_load]
     return data_list, num_counts
 
 
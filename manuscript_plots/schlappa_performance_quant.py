@@ -12,6 +12,8 @@ set_plot_params.init_paper_small()
 import pax_simulation_pipeline
 from manuscript_plots import schlappa_performance
 
+TOO_LOW = -2     # Counts below which a well-defined first loss peak isn't reliably retrieved
+
 
 def make_figure():
     log10_counts = schlappa_performance.LOG10_COUNTS_LIST
@@ -51,36 +53,47 @@ def _format_figure(axs):
 
 
 def _rmse_plot(ax, num_electrons, data_list):
-    norm_rmse_list = []
-    for data in data_list:
-        data = data["additional_deconvolutions"]
+    norm_rmse_list = [get_norm_rmse(data) for data in data_list]
+    ax.semilogx(num_electrons, norm_rmse_list, color="r", marker="o", markersize=4)
+
+
+def _fwhm_plot(ax, num_electrons, data_list):
+    fwhm_list = [get_median_fwhm(data) for data in data_list[:TOO_LOW]]
+    ax.semilogx(
+        num_electrons[:TOO_LOW], 1e3 * np.array(fwhm_list), color="r", marker="o", markersize=4
+    )
+
+
+def get_norm_rmse(data):
+    """Return RMSE of additional deconvolutions of a simulation, normalized by the max of the ground truth
+    """
+    data = data["additional_deconvolutions"]
+    if hasattr(data, "metrics"):
+        # deconvolutions stored on disk come with their MSEs
+        mse_list = data.metrics["deconvolved_mse"]
+    else:
         mse_list = []
         for deconvolved in data:
             mse = mean_squared_error(
                 deconvolved.deconvolved_y_, deconvolved.ground_truth_y
             )
             mse_list.append(mse)
-        deconvolved_mse = np.mean(mse_list)
-        rmse = np.sqrt(deconvolved_mse)
-        norm_rmse = rmse / np.amax(data[0].ground_truth_y)
-        norm_rmse_list.append(norm_rmse)
-    ax.semilogx(num_electrons, norm_rmse_list, color="r", marker="o", markersize=4)
+    deconvolved_mse = np.mean(mse_list)
+    rmse = np.sqrt(deconvolved_mse)
+    norm_rmse = rmse / np.amax(data[0].ground_truth_y)
+    return norm_rmse
 
 
-def _fwhm_plot(ax, num_electrons, data_list):
-    TOO_LOW = -2     # Counts below which a well-defined first loss peak isn't reliably retrieved
-    fwhm_list = []
-    for data in data_list[:TOO_LOW]:
-        data = data["additional_deconvolutions"]
-        current_fwhms = []
-        for deconvolved in data:
-            fwhm = _get_fwhm(deconvolved.deconvolved_x, deconvolved.deconvolved_y_)
-            current_fwhms.append(fwhm)
-        fwhm = np.median(current_fwhms)
-        fwhm_list.append(fwhm)
-    ax.semilogx(
-        num_electrons[:TOO_LOW], 1e3 * np.array(fwhm_list), color="r", marker="o", markersize=4
-    )
+def get_median_fwhm(data):
+    """Return median FWHM (eV) of the first loss peak in additional deconvolutions of a simulation
+    """
+    data = data["additional_deconvolutions"]
+    current_fwhms = []
+    for deconvolved in data:
+        fwhm = _get_fwhm(deconvolved.deconvolved_x, deconvolved.deconvolved_y_)
+        current_fwhms.append(fwhm)
+    fwhm = np.median(current_fwhms)
+    return fwhm
 
 
 def _get_fwhm(deconvolved_x, deconvolved_y, center=0.0, width=1.0):
@@ -0,0 +1,52 @@
+"""
+Lightweight in-process recording of metrics during iterative deconvolution.
+
+Metrics are stored every few iterations in a preallocated NumPy ring buffer
+and returned as a structured array, with an "iteration" field and one field
+per metric, e.g. to be saved with np.savez.
+"""
+
+import numpy as np
+
+
+class MetricsRecorder:
+    """Ring buffer of metrics recorded every `every` iterations
+
+    If more than capacity records are made, the oldest ones are overwritten.
+    """
+
+    def __init__(self, names, capacity, every=1):
+        self.names = list(names)
+        self.capacity = capacity
+        self.every = every
+        dtype = [("iteration", np.int64)] + [(name, np.float64) for name in names]
+        self._buffer = np.zeros(capacity, dtype=dtype)
+        self._count = 0
+
+    def record(self, iteration, **metrics):
+        row = self._buffer[self._count % self.capacity]
+        row["iteration"] = iteration
+        for name in self.names:
+            row[name] = metrics[name]
+        self._count += 1
+
+    def to_array(self):
+        """Return the recorded metrics in the order they were recorded
+        """
+        if self._count <= self.capacity:
+            return self._buffer[: self._count].copy()
+        return np.roll(self._buffer, -(self._count % self.capacity))
+
+
+def deconvolution_mse_callback(recorder, ground_truth_y, validation_y):
+    """Return an lr_fister callback recording deconvolved and validation reconstruction MSEs
+    """
+
+    def callback(iteration, estimate, reconstruction):
+        recorder.record(
+            iteration,
+            deconvolved_mse=np.mean((estimate - ground_truth_y) ** 2),
+            validation_mse=np.mean((reconstruction - validation_y) ** 2),
+        )
+
+    return callback
@@ -0,0 +1,223 @@
+"""
+Registry of noiseless PAX models shared between simulation runs.
+
+The RIXS model, the photoemission impulse response and the noiseless PAX
+spectrum only depend on (rixs, photoemission, energy_loss). Each combination is
+built once, saved to disk as .npy files and memory mapped by every process that
+needs it, so joblib workers get zero-copy views and only have to draw noise.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
+from scipy.signal import fftconvolve
+
+from pax_deconvolve.pax_simulations import simulate_pax
+
+MODELS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "simulated_results", "models"
+)
+_MODEL_ARRAYS = [
+    "impulse_response_x",
+    "impulse_response_y",
+    "xray_x",
+    "xray_y",
+    "pax_x",
+    "noiseless_pax_y",
+]
+# models already loaded by this process, keyed by _get_key
+_MODELS = {}
+
+
+def get_model(rixs, photoemission, energy_loss):
+    """Return (memory mapped) arrays of a noiseless PAX model, building it if needed
+    """
+    key = _get_key(rixs, photoemission, energy_loss)
+    if key not in _MODELS:
+        model_dir = os.path.join(MODELS_DIR, key)
+        if not os.path.isdir(model_dir):
+            _build_model(model_dir, rixs, photoemission, energy_loss)
+        _MODELS[key] = _load_model(model_dir)
+    return _MODELS[key]
+
+
+def simulate_from_presets(
+    log10_num_electrons,
+    rixs,
+    photoemission,
+    num_simulations,
+    energy_loss,
+    seed=None,
+    dtype=float,
+):
+    """Simulate PAX spectra from a registered model
+
+    Takes the same arguments and returns the same (impulse_response,
+    pax_spectra, xray_xy) as simulate_pax.simulate_from_presets, but only
+    draws new Poisson noise on top of the cached noiseless spectrum. The
+    spectra, impulse response and ground truth are returned as dtype, e.g.
+    np.float32 to halve their memory.
+    """
+    model = get_model(rixs, photoemission, energy_loss)
+    pax_y = draw_spectra(
+        model["noiseless_pax_y"],
+        10 ** log10_num_electrons,
+        num_simulations,
+        seed,
+        dtype,
+    )
+    impulse_response, pax_x, xray_xy = get_model_inputs(
+        rixs, photoemission, energy_loss, dtype
+    )
+    return impulse_response, {"x": pax_x, "y": pax_y}, xray_xy
+
+
+def get_model_inputs(rixs, photoemission, energy_loss, dtype=float):
+    """Return the impulse response, PAX x-values and X-ray spectrum of a model
+
+    These are returned like by simulate_from_presets, for spectra drawn
+    separately, e.g. with draw_spectra.
+    """
+    model = get_model(rixs, photoemission, energy_loss)
+    impulse_response = {
+        "x": model["impulse_response_x"],
+        "y": model["impulse_response_y"].astype(dtype, copy=False),
+    }
+    xray_xy = {"x": model["xray_x"], "y": model["xray_y"].astype(dtype, copy=False)}
+    return impulse_response, model["pax_x"], xray_xy
+
+
+def validation_spectrum(
+    log10_num_electrons, rixs, photoemission, num_simulations, energy_loss, seed=0,
+):
+    """Return the mean spectrum of a simulated validation set, cached on disk
+
+    The set is generated once per model, number of electrons, number of
+    spectra and seed, and stored as its summed detected electrons per point
+    ("counts") together with the mean spectrum ("y"). Since a sum of
+    independent Poisson draws is itself a Poisson draw, the summed counts are
+    drawn directly instead of simulating every spectrum.
+    """
+    key = _get_key(rixs, photoemission, energy_loss)
+    file_name = os.path.join(
+        MODELS_DIR,
+        f"validation_{key}_1E{log10_num_electrons}_{num_simulations}_{seed}.npz",
+    )
+    if not os.path.exists(file_name):
+        model = get_model(rixs, photoemission, energy_loss)
+        noiseless_pax_y = model["noiseless_pax_y"]
+        single_electron = (
+            num_simulations * np.sum(noiseless_pax_y) / (10 ** log10_num_electrons)
+        )
+        rng = np.random.default_rng(seed)
+        counts = rng.poisson(num_simulations * noiseless_pax_y / single_electron)
+        _save_atomically(
+            file_name,
+            x=model["pax_x"],
+            y=counts * single_electron / num_simulations,
+            counts=counts,
+        )
+    with np.load(file_name) as data:
+        return {name: data[name] for name in data.files}
+
+
+def draw_spectra(
+    noiseless_pax_y, num_electrons, num_simulations, seed=None, dtype=float
+):
+    """Return num_simulations Poisson-noised copies of a noiseless PAX spectrum
+
+    The expected number of detected electrons summed over all spectra is
+    num_electrons. Spectra are returned in the units of noiseless_pax_y, so
+    their mean is an unbiased estimate of it.
+    """
+    rng = np.random.default_rng(seed)
+    single_electron = num_simulations * np.sum(noiseless_pax_y) / num_electrons
+    expected_counts = noiseless_pax_y / single_electron
+    counts = rng.poisson(expected_counts, size=(num_simulations, len(expected_counts)))
+    return np.multiply(counts, single_electron, dtype=dtype)
+
+
+def expected_pax_spectrum(xray_xy, photoemission_xy):
+    """Return the exact noiseless PAX spectrum of an X-ray and a photoemission spectrum
+
+    The spectrum is the X-ray spectrum convolved with the impulse response,
+    computed by FFT convolution without any sampling. It is in the units of
+    the noiseless_pax_y of registered models, so it is also the mean of the
+    spectra draw_spectra draws from it, whatever their number of electrons.
+    Results are memoized on disk by the input spectra.
+    """
+    hasher = hashlib.sha1()
+    for array in [
+        xray_xy["x"],
+        xray_xy["y"],
+        photoemission_xy["x"],
+        photoemission_xy["y"],
+    ]:
+        hasher.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    file_name = os.path.join(MODELS_DIR, f"noiseless_{hasher.hexdigest()[:16]}.npz")
+    if not os.path.exists(file_name):
+        # a single electron gives the impulse response and kinetic energies
+        impulse_response, pax_spectra = simulate_pax.simulate(
+            xray_xy, photoemission_xy, 1, 1
+        )
+        noiseless_pax_y = fftconvolve(xray_xy["y"], impulse_response["y"], mode="valid")
+        os.makedirs(MODELS_DIR, exist_ok=True)
+        _save_atomically(file_name, x=pax_spectra["x"], y=noiseless_pax_y)
+    with np.load(file_name) as data:
+        return {"x": data["x"], "y": data["y"]}
+
+
+def _build_model(model_dir, rixs, photoemission, energy_loss):
+    # a single, (practically) noiseless draw gives us the model spectra and axes
+    impulse_response, pax_spectra, xray_xy = simulate_pax.simulate_from_presets(
+        0.0, rixs, photoemission, 1, energy_loss
+    )
+    noiseless_pax_y = fftconvolve(xray_xy["y"], impulse_response["y"], mode="valid")
+    if len(noiseless_pax_y) != len(pax_spectra["x"]):
+        raise ValueError(
+            "Noiseless PAX spectrum does not match the simulated kinetic energies"
+        )
+    arrays = {
+        "impulse_response_x": impulse_response["x"],
+        "impulse_response_y": impulse_response["y"],
+        "xray_x": xray_xy["x"],
+        "xray_y": xray_xy["y"],
+        "pax_x": pax_spectra["x"],
+        "noiseless_pax_y": noiseless_pax_y,
+    }
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=MODELS_DIR)
+    for name, array in arrays.items():
+        np.save(os.path.join(temp_dir, name + ".npy"), np.asarray(array, dtype=float))
+    try:
+        os.rename(temp_dir, model_dir)
+    except OSError:
+        # another process registered the same model first
+        shutil.rmtree(temp_dir)
+
+
+def _save_atomically(file_name, **arrays):
+    """Save arrays to an .npz file that other processes never see partially written
+    """
+    handle, temp_name = tempfile.mkstemp(dir=os.path.dirname(file_name), suffix=".tmp")
+    with os.fdopen(handle, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temp_name, file_name)
+
+
+def _load_model(model_dir):
+    model = {}
+    for name in _MODEL_ARRAYS:
+        array = np.load(os.path.join(model_dir, name + ".npy"), mmap_mode="r")
+        model[name] = array.view(np.ndarray)
+    return model
+
+
+def _get_key(rixs, photoemission, energy_loss):
+    hasher = hashlib.sha1()
+    hasher.update(repr(rixs).encode())
+    hasher.update(repr(photoemission).encode())
+    hasher.update(np.ascontiguousarray(energy_loss, dtype=float).tobytes())
+    return hasher.hexdigest()[:16]
@@ -5,15 +5,23 @@ Pipeline for running, analyzing, saving, and loading PAX simulations.
 import numpy as np
 import os
 import pickle
+import types
 from sklearn.model_selection import GridSearchCV
 import pprint
 from joblib import Parallel, delayed
 
-from pax_deconvolve.deconvolution import deconvolvers
-from pax_deconvolve.pax_simulations import simulate_pax
+import model_registry
+import profiling
+import regularization_search
+import result_summary
+import shared_arrays
+import sweep_results
 
 # Set global simulation parameters
-PROCESSED_DATA_DIR = os.path.join(os.path.dirname(__file__), "simulated_results")
+# (absolute, so that work_queue workers started in any directory save here)
+PROCESSED_DATA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "simulated_results"
+)
 # Set default simulation parameters
 DEFAULT_PARAMETERS = {
     "energy_loss": np.arange(-8, 10, 0.01),
@@ -21,7 +29,53 @@ DEFAULT_PARAMETERS = {
     "simulations": 1000,
     "cv_fold": 3,
     "regularizer_widths": np.logspace(-3, -1, 10),
+    # "grid" evaluates all regularizer_widths, "adaptive" searches their range,
+    # "halving" drops poorly performing regularizer_widths early and "batched"
+    # evaluates all regularizer_widths, fitting all folds of each at once
+    "regularization_search": "grid",
+    # "memory" keeps the additional deconvolvers in the result, "disk" reduces
+    # them to their outputs and metrics, written to disk as they complete
+    "additional_storage": "memory",
+    # None runs pax_deconvolve's float64 deconvolvers, np.float32 simulates and
+    # deconvolves in single precision with richardson_lucy's reimplementation
+    # (see run_simulations/float32_accuracy.py for its accuracy against
+    # pax_deconvolve)
+    "dtype": None,
+    # None runs the standard LR update, "biggs_andrews" or "nesterov" an
+    # accelerated update with richardson_lucy (not with the "grid" search).
+    # These get as far in fewer iterations, so reduce "iterations" with them
+    # (see benchmarks/acceleration.py)
+    "acceleration": None,
+    # > 0 starts the deconvolutions with richardson_lucy on that many coarser
+    # energy grids (not with the "grid" search), running half of the
+    # iterations of each grid on the next coarser one, where they cost half
+    "coarse_levels": 0,
+    # not None convolves the tails of the impulse response that are flat to
+    # within this fraction of its maximum as constants with richardson_lucy
+    # (not with the "grid" search), which shortens the FFTs by their length
+    "tail_tolerance": None,
+    # "numba" runs the element-wise steps of the LR update in compiled kernels
+    # with richardson_lucy (not with the "grid" search), falling back to
+    # "numpy" if Numba is not installed (see benchmarks/lr_backend.py)
+    "backend": "numpy",
 }
+# Large deconvolver outputs returned from workers through shared memory, with the
+# attribute holding their x-values:
+_OUTPUT_ARRAYS = {
+    "measured_y_": "convolved_x",
+    "reconstruction_y_": "convolved_x",
+    "deconvolved_y_": "deconvolved_x",
+}
+# Large deconvolver inputs that are the same for all deconvolutions of a run:
+_SHARED_ARRAYS = [
+    "impulse_response_x",
+    "impulse_response_y",
+    "convolved_x",
+    "deconvolved_x",
+    "ground_truth_y",
+]
+# Metrics kept for each additional deconvolution when they are stored on disk:
+_METRICS = ["deconvolved_mse", "reconstruction_mse"]
 # good energy_loss for Ag 3d levels with Schlappa RIXS: np.arange(-8, 10, 0.005)
 # good energy_loss for Fermi edge and doublet with < 0.4 eV separation: np.arange(-0.5, 0.5, 0.001)
 # good regularizer_widths for Ag 3d: np.logspace(-3, -1, 10)
@@ -35,8 +89,12 @@ def run(
     num_additional=25,
     **kwargs
 ):
-    parameters = DEFAULT_PARAMETERS
+    parameters = dict(DEFAULT_PARAMETERS)
     parameters.update(kwargs)
+    profile = profiling.Profile()
+    with profile.stage("build_model"):
+        # build the noiseless model once so that workers only memory map it
+        model_registry.get_model(rixs, photoemission, parameters["energy_loss"])
     print("Starting cv deconvolver")
     cv_deconvolver, pax_spectra = _run_cv(
         log10_num_electrons,
@@ -44,18 +102,23 @@ def run(
         photoemission,
         parameters["regularizer_widths"],
         parameters,
+        profile,
     )
     regularization_strength = cv_deconvolver.best_regularization_strength_
     print("Completed cv deconvolver")
-    additional_deconvolutions = Parallel(n_jobs=-1)(
-        delayed(_run_single_regularizer)(
-            log10_num_electrons,
-            rixs,
-            photoemission,
-            regularization_strength,
-            parameters,
-        )
-        for _ in range(num_additional)
+    if parameters["additional_storage"] == "disk":
+        run_additional = _run_additional_to_disk
+    else:
+        run_additional = _run_additional
+    additional_deconvolutions = run_additional(
+        log10_num_electrons,
+        rixs,
+        photoemission,
+        regularization_strength,
+        parameters,
+        num_additional,
+        cv_deconvolver,
+        profile,
     )
     to_save = {
         "cv_deconvolver": cv_deconvolver,
@@ -63,56 +126,288 @@ def run(
         "pax_spectra": pax_spectra,
     }
     file_name = _get_filename(log10_num_electrons, rixs, photoemission)
-    with open(file_name, "wb") as f:
-        pickle.dump(to_save, f)
+    with profile.stage("save"):
+        os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
+        with open(file_name, "wb") as f:
+            pickle.dump(to_save, f)
+        _save_summary(to_save, log10_num_electrons, rixs, photoemission)
+        _add_to_sweep(to_save, log10_num_electrons, rixs, photoemission)
+    profiling.save(
+        profile.records,
+        _get_profile_filename(log10_num_electrons, rixs, photoemission),
+    )
+    to_save["profile"] = profile.records
     return to_save
 
 
 def _run_cv(
-    log10_num_electrons, rixs, photoemission, regularization_strengths, parameters
+    log10_num_electrons,
+    rixs,
+    photoemission,
+    regularization_strengths,
+    parameters,
+    profile,
 ):
-    impulse_response, pax_spectra, xray_xy = simulate_pax.simulate_from_presets(
-        log10_num_electrons,
-        rixs,
-        photoemission,
-        parameters["simulations"],
-        parameters["energy_loss"],
-    )
-    deconvolver = deconvolvers.LRFisterGrid(
-        impulse_response["x"],
-        impulse_response["y"],
+    with profile.stage("simulate"):
+        impulse_response, pax_spectra, xray_xy = model_registry.simulate_from_presets(
+            log10_num_electrons,
+            rixs,
+            photoemission,
+            parameters["simulations"],
+            parameters["energy_loss"],
+            dtype=_get_dtype(parameters),
+        )
+    deconvolver = regularization_search.make_cv_deconvolver(
+        parameters["regularization_search"],
+        impulse_response,
         pax_spectra["x"],
         parameters["regularizer_widths"],
         parameters["iterations"],
         xray_xy["y"],
         parameters["cv_fold"],
+        parameters["dtype"],
+        parameters["acceleration"],
+        parameters["coarse_levels"],
+        parameters["tail_tolerance"],
+        parameters["backend"],
     )
-    deconvolver.fit(np.array(pax_spectra["y"]))
+    with profile.stage("cv_fit") as record:
+        deconvolver.fit(np.array(pax_spectra["y"]))
+        record["iterations"] = profiling.cv_iterations(deconvolver)
+    profile.extend(profiling.cv_candidate_records(deconvolver))
     return deconvolver, pax_spectra
 
 
+def _run_additional(
+    log10_num_electrons,
+    rixs,
+    photoemission,
+    regularization_strength,
+    parameters,
+    num_additional,
+    cv_deconvolver,
+    profile,
+):
+    """Run additional deconvolutions in parallel, returning their outputs through shared memory
+
+    Each worker draws the spectra of its deconvolution from the cached
+    noiseless model, with a seed spawned for it from one SeedSequence, so
+    that the replicates are independent without holding all of them at once.
+    """
+    seeds = np.random.SeedSequence().spawn(num_additional)
+    with shared_arrays.shared_folder() as folder:
+        output_handles = {
+            name: shared_arrays.create(
+                folder,
+                name,
+                (num_additional, len(getattr(cv_deconvolver, x_name))),
+                _get_dtype(parameters),
+            )
+            for name, x_name in _OUTPUT_ARRAYS.items()
+        }
+        with profile.stage(
+            "additional_deconvolutions",
+            iterations=int(num_additional * parameters["iterations"]),
+        ):
+            results = Parallel(n_jobs=-1)(
+                delayed(_run_single_regularizer)(
+                    log10_num_electrons,
+                    rixs,
+                    photoemission,
+                    regularization_strength,
+                    parameters,
+                    output_handles,
+                    ind,
+                    seed=seeds[ind],
+                )
+                for ind in range(num_additional)
+            )
+        outputs = {
+            name: np.array(shared_arrays.attach(handle))
+            for name, handle in output_handles.items()
+        }
+    additional_deconvolutions = []
+    for deconvolver, records in results:
+        additional_deconvolutions.append(deconvolver)
+        profile.extend(records)
+    for ind, deconvolver in enumerate(additional_deconvolutions):
+        for name in _SHARED_ARRAYS:
+            setattr(deconvolver, name, getattr(cv_deconvolver, name))
+        for name, output in outputs.items():
+            setattr(deconvolver, name, output[ind])
+    return additional_deconvolutions
+
+
+def _run_additional_to_disk(
+    log10_num_electrons,
+    rixs,
+    photoemission,
+    regularization_strength,
+    parameters,
+    num_additional,
+    cv_deconvolver,
+    profile,
+):
+    """Run additional deconvolutions in parallel, writing their outputs to disk as they complete
+
+    Workers write the outputs of each deconvolution to its row of .npy files
+    next to the result and send back only its metrics, so memory use does not
+    grow with num_additional. Spectra are drawn like by _run_additional.
+    """
+    seeds = np.random.SeedSequence().spawn(num_additional)
+    dirname = _get_additional_dirname(log10_num_electrons, rixs, photoemission)
+    directory = os.path.join(PROCESSED_DATA_DIR, dirname)
+    os.makedirs(directory, exist_ok=True)
+    output_handles = {
+        name: shared_arrays.create(
+            directory,
+            name,
+            (num_additional, len(getattr(cv_deconvolver, x_name))),
+            _get_dtype(parameters),
+        )
+        for name, x_name in _OUTPUT_ARRAYS.items()
+    }
+    metrics = np.zeros(num_additional, dtype=[(name, float) for name in _METRICS])
+    with profile.stage(
+        "additional_deconvolutions",
+        iterations=int(num_additional * parameters["iterations"]),
+    ):
+        results = Parallel(n_jobs=-1, return_as="generator_unordered")(
+            delayed(_run_single_regularizer)(
+                log10_num_electrons,
+                rixs,
+                photoemission,
+                regularization_strength,
+                parameters,
+                output_handles,
+                ind,
+                reduce=True,
+                seed=seeds[ind],
+            )
+            for ind in range(num_additional)
+        )
+        for (ind, deconvolution_metrics), records in results:
+            for name in _METRICS:
+                metrics[ind][name] = deconvolution_metrics[name]
+            profile.extend(records)
+    np.save(os.path.join(directory, "metrics.npy"), metrics)
+    return StoredDeconvolutions(
+        dirname,
+        {name: getattr(cv_deconvolver, name) for name in _SHARED_ARRAYS},
+        regularization_strength,
+        metrics,
+    )
+
+
+class StoredDeconvolutions:
+    """Additional deconvolutions whose outputs are stored on disk
+
+    Behaves like the list of deconvolvers stored otherwise: items have the
+    attributes of fitted deconvolvers used by the figures, read one at a time
+    from memory mapped files. The metrics of all deconvolutions are in metrics.
+    """
+
+    def __init__(self, dirname, shared, regularization_strength, metrics):
+        self.dirname = dirname
+        self.shared = shared
+        self.regularization_strength = regularization_strength
+        self.metrics = metrics
+
+    def __len__(self):
+        return len(self.metrics)
+
+    def __getitem__(self, index):
+        attributes = dict(self.shared)
+        for name in _OUTPUT_ARRAYS:
+            handle = os.path.join(PROCESSED_DATA_DIR, self.dirname, name + ".npy")
+            attributes[name] = np.array(shared_arrays.attach(handle)[index])
+        return types.SimpleNamespace(
+            regularization_strength=self.regularization_strength, **attributes
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
 def _run_single_regularizer(
-    log10_num_electrons, rixs, photoemission, regularizer_width, parameters
+    log10_num_electrons,
+    rixs,
+    photoemission,
+    regularizer_width,
+    parameters,
+    output_handles=None,
+    index=None,
+    reduce=False,
+    seed=None,
 ):
     """Run deconvolution for a single input regularization strength
+
+    Returns the fitted deconvolver and the profile records of the deconvolution.
+    The PAX spectra are drawn with seed, e.g. a spawned SeedSequence. If
+    output_handles are given, the large arrays of the fitted deconvolver are
+    written to row index of the shared outputs and removed from the returned
+    deconvolver, so that only a small object is sent back to the parent. If reduce, (index, metrics) is returned instead of the
+    deconvolver.
     """
-    impulse_response, pax_spectra, xray_xy = simulate_pax.simulate_from_presets(
-        log10_num_electrons,
-        rixs,
-        photoemission,
-        parameters["simulations"],
-        parameters["energy_loss"],
-    )
-    deconvolver = deconvolvers.LRFisterDeconvolve(
+    profile = profiling.Profile()
+    with profile.stage("additional_simulate", index=index):
+        impulse_response, pax_spectra, xray_xy = model_registry.simulate_from_presets(
+            log10_num_electrons,
+            rixs,
+            photoemission,
+            parameters["simulations"],
+            parameters["energy_loss"],
+            seed=seed,
+            dtype=_get_dtype(parameters),
+        )
+    deconvolver = regularization_search.make_deconvolver(
         impulse_response["x"],
         impulse_response["y"],
         pax_spectra["x"],
         regularizer_width,
-        iterations=parameters["iterations"],
-        ground_truth_y=xray_xy["y"],
+        parameters["iterations"],
+        xray_xy["y"],
+        parameters["dtype"],
+        parameters["acceleration"],
+        parameters["coarse_levels"],
+        parameters["tail_tolerance"],
+        parameters["backend"],
     )
-    deconvolver.fit(np.array(pax_spectra["y"]))
-    return deconvolver
+    with profile.stage(
+        "additional_deconvolution",
+        iterations=int(parameters["iterations"]),
+        index=index,
+    ):
+        deconvolver.fit(np.array(pax_spectra["y"]))
+    if reduce:
+        result = (index, _get_metrics(deconvolver))
+    else:
+        result = deconvolver
+    if output_handles is not None:
+        for name, handle in output_handles.items():
+            shared_output = shared_arrays.attach(handle, writeable=True)
+            shared_output[index] = getattr(deconvolver, name)
+            shared_output.flush()
+            setattr(deconvolver, name, None)
+        for name in _SHARED_ARRAYS:
+            setattr(deconvolver, name, None)
+    return result, profile.records
+
+
+def _get_dtype(parameters):
+    return float if parameters["dtype"] is None else parameters["dtype"]
+
+
+def _get_metrics(deconvolver):
+    return {
+        "deconvolved_mse": np.mean(
+            (deconvolver.deconvolved_y_ - deconvolver.ground_truth_y) ** 2
+        ),
+        "reconstruction_mse": np.mean(
+            (deconvolver.reconstruction_y_ - deconvolver.measured_y_) ** 2
+        ),
+    }
 
 
 def load(log10_num_electrons, rixs="schlappa", photoemission="ag"):
@@ -124,19 +419,126 @@ def load(log10_num_electrons, rixs="schlappa", photoemission="ag"):
     return data
 
 
+def load_summary(log10_num_electrons, rixs="schlappa", photoemission="ag"):
+    """Load the compact summary of a PAX simulation, for plotting
+
+    Returns a dictionary like load, but with "cv_deconvolver" and
+    "additional_deconvolutions" only, holding DeconvolutionSummary records. The
+    summary is made from the full result if it was not saved with it.
+    """
+    file_name = _get_summary_filename(log10_num_electrons, rixs, photoemission)
+    if not os.path.exists(file_name):
+        data = load(log10_num_electrons, rixs, photoemission)
+        _save_summary(data, log10_num_electrons, rixs, photoemission)
+    summary = result_summary.load(file_name)
+    return _unpack_summary(summary)
+
+
+def load_sweep_summaries(log10_counts_list, rixs="schlappa", photoemission="ag"):
+    """Load the compact summaries of several numbers of electrons from the sweep file
+
+    Returns a list of dictionaries like load_summary. Numbers of electrons that
+    are not in the sweep file yet are added to it from their own results.
+    """
+    sweep = sweep_results.SweepResults(_get_sweep_filename(rixs, photoemission))
+    stored_levels = sweep.levels()
+    data_list = []
+    for log10_num_electrons in log10_counts_list:
+        if log10_num_electrons not in stored_levels:
+            data = load_summary(log10_num_electrons, rixs, photoemission)
+            _add_to_sweep(data, log10_num_electrons, rixs, photoemission)
+        shared, rows = sweep[log10_num_electrons]
+        data_list.append(
+            _unpack_summary(result_summary.from_arrays({**shared, **rows}))
+        )
+    return data_list
+
+
+def _save_summary(data, log10_num_electrons, rixs, photoemission):
+    result_summary.save(
+        _get_summary_filename(log10_num_electrons, rixs, photoemission),
+        _get_summary_groups(data),
+    )
+
+
+def _add_to_sweep(data, log10_num_electrons, rixs, photoemission):
+    """Add (or replace) the summary of a number of electrons in the sweep file
+    """
+    sweep = sweep_results.SweepResults(_get_sweep_filename(rixs, photoemission))
+    shared, rows = result_summary.to_arrays(_get_summary_groups(data))
+    sweep.write(log10_num_electrons, rows, shared)
+
+
+def _get_summary_groups(data):
+    return {
+        "cv_deconvolver": [data["cv_deconvolver"]],
+        "additional_deconvolutions": data["additional_deconvolutions"],
+    }
+
+
+def _unpack_summary(summary):
+    return {
+        "cv_deconvolver": summary["cv_deconvolver"][0],
+        "additional_deconvolutions": summary["additional_deconvolutions"],
+    }
+
+
 def print_parameters(log10_num_electrons, rixs="schlappa", photoemission="ag"):
     """Load a PAX simulation and print some parameters it was run with
     """
     data = load(log10_num_electrons, rixs, photoemission)
+    if hasattr(data["cv_deconvolver"], "regularization_strengths_"):
+        # adaptive searches record the strengths they evaluated
+        regularizer_widths = data["cv_deconvolver"].regularization_strengths_
+    else:
+        regularizer_widths = data["cv_deconvolver"].regularization_strengths
     to_print = {
         "iterations": data["cv_deconvolver"].iterations,
         "cv_fold": data["cv_deconvolver"].cv_,
-        "regularizer_widths": data["cv_deconvolver"].regularization_strengths,
+        "regularizer_widths": regularizer_widths,
         "shape of input PAX data": np.shape(data["pax_spectra"]["y"]),
     }
     pprint.pprint(to_print)
 
 
+def load_profile(log10_num_electrons, rixs="schlappa", photoemission="ag"):
+    """Load the per-stage profile records of a PAX simulation
+    """
+    return profiling.load(
+        _get_profile_filename(log10_num_electrons, rixs, photoemission)
+    )
+
+
+def print_profile_summary(log10_counts_list, rixs="schlappa", photoemission="ag"):
+    """Print where the compute of a sweep of PAX simulations went, by stage
+    """
+    profiles = [
+        load_profile(log10_num_electrons, rixs, photoemission)
+        for log10_num_electrons in log10_counts_list
+    ]
+    profiling.print_summary(profiling.summarize(profiles))
+
+
+def _get_additional_dirname(log10_num_electrons, rixs, photoemission):
+    return "{}_{}_rixs_1E{}_additional".format(photoemission, rixs, log10_num_electrons)
+
+
+def _get_sweep_filename(rixs, photoemission):
+    return "{}/{}_{}_rixs_sweep.npz".format(PROCESSED_DATA_DIR, photoemission, rixs)
+
+
+def _get_summary_filename(log10_num_electrons, rixs, photoemission):
+    return "{}/{}_{}_rixs_1E{}_summary.npz".format(
+        PROCESSED_DATA_DIR, photoemission, rixs, log10_num_electrons
+    )
+
+
+def _get_profile_filename(log10_num_electrons, rixs, photoemission):
+    return "{}/{}_{}_rixs_1E{}_profile.json".format(
+        PROCESSED_DATA_DIR, photoemission, rixs, log10_num_electrons
+    )
+
+
 def _get_filename(log10_num_electrons, rixs, photoemission):
     file_name = "{}/{}_{}_rixs_1E{}.pickle".format(
         PROCESSED_DATA_DIR, photoemission, rixs, log10_num_electrons
@@ -0,0 +1,195 @@
+"""
+Per-stage profiling of pipeline runs.
+
+A Profile collects one record per stage of a run (simulate, CV fit, each
+additional deconvolution, save, ...) holding its wall time, CPU time,
+iterations and peak resident set size. Records are plain dictionaries, so they
+can be returned from joblib workers, saved as JSON next to the results and
+summarized across a sweep.
+
+CPU time and peak RSS are those of the process running the stage. Stages that
+fan out to joblib workers therefore report the workers' cost in the records the
+workers return, not in their own record.
+"""
+
+import contextlib
+import json
+import resource
+import time
+import numpy as np
+
+_PROC_STATUS = "/proc/self/status"
+_PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+class Profile:
+    """Collection of stage records
+    """
+
+    def __init__(self):
+        self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, name, iterations=0, **info):
+        """Record the cost of the enclosed block as stage name
+
+        The record is yielded so that e.g. the number of iterations can be set
+        once it is known.
+        """
+        record = {"stage": name, "iterations": iterations}
+        record.update(info)
+        reset_peak_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_time"] = time.perf_counter() - wall_start
+            record["cpu_time"] = time.process_time() - cpu_start
+            record["peak_rss_kb"] = peak_rss_kb()
+            self.records.append(record)
+
+    def extend(self, records):
+        self.records.extend(records)
+
+
+def cv_iterations(search):
+    """Return the total number of LR iterations run by fitting a cross-validated search
+
+    This includes the refit with the best regularization strength.
+    """
+    if hasattr(search, "total_iterations_"):
+        return int(search.total_iterations_ + search.iterations)
+    if hasattr(search, "regularization_strengths_"):
+        num_strengths = len(search.regularization_strengths_)
+    else:
+        num_strengths = len(search.regularization_strengths)
+    return int((num_strengths * search.cv_folds + 1) * search.iterations)
+
+
+def cv_candidate_records(search):
+    """Return records of the candidates of a fitted cross-validated search
+
+    Searches that profile each fold themselves (cv_profile_) return those
+    records. For searches with sklearn cv_results_, one record is made per
+    candidate (and round) from the mean fit and score times, without CPU time
+    or peak RSS. Otherwise there are no candidate records.
+    """
+    if hasattr(search, "cv_profile_"):
+        return list(search.cv_profile_)
+    if not hasattr(search, "cv_results_"):
+        return []
+    results = search.cv_results_
+    num_folds = search.cv_folds
+    if "n_resources" in results:
+        iterations = results["n_resources"]
+    else:
+        iterations = np.full(len(results["params"]), search.iterations)
+    records = []
+    for params, fit_time, score_time, candidate_iterations in zip(
+        results["params"],
+        results["mean_fit_time"],
+        results["mean_score_time"],
+        iterations,
+    ):
+        records.append(
+            {
+                "stage": "cv_candidate",
+                "iterations": int(candidate_iterations * num_folds),
+                "regularization_strength": params["regularization_strength"],
+                "wall_time": (fit_time + score_time) * num_folds,
+                "cpu_time": None,
+                "peak_rss_kb": None,
+            }
+        )
+    return records
+
+
+def summarize(profiles):
+    """Return totals per stage over one or more lists of stage records
+
+    For each stage, the number of records, the total wall and CPU time, the
+    total iterations, the wall time per iteration and the largest peak RSS are
+    returned.
+    """
+    if profiles and isinstance(profiles[0], dict):
+        profiles = [profiles]
+    summary = {}
+    for record in (record for records in profiles for record in records):
+        totals = summary.setdefault(
+            record["stage"],
+            {
+                "count": 0,
+                "wall_time": 0.0,
+                "cpu_time": 0.0,
+                "iterations": 0,
+                "peak_rss_kb": 0,
+            },
+        )
+        totals["count"] += 1
+        totals["wall_time"] += record["wall_time"]
+        totals["cpu_time"] += record["cpu_time"] or 0.0
+        totals["iterations"] += record["iterations"]
+        totals["peak_rss_kb"] = max(totals["peak_rss_kb"], record["peak_rss_kb"] or 0)
+    for totals in summary.values():
+        totals["wall_time_per_iteration"] = (
+            totals["wall_time"] / totals["iterations"] if totals["iterations"] else None
+        )
+    return summary
+
+
+def print_summary(summary):
+    """Print a summary from summarize as a table, most expensive stage first
+    """
+    print(
+        f"{'stage':<28}{'count':>7}{'wall (s)':>12}{'cpu (s)':>12}"
+        f"{'iterations':>14}{'peak RSS (MB)':>15}"
+    )
+    by_wall_time = sorted(summary.items(), key=lambda item: -item[1]["wall_time"])
+    for stage, totals in by_wall_time:
+        print(
+            f"{stage:<28}{totals['count']:>7}{totals['wall_time']:>12.1f}"
+            f"{totals['cpu_time']:>12.1f}{totals['iterations']:>14.3g}"
+            f"{totals['peak_rss_kb'] / 1024:>15.0f}"
+        )
+
+
+def save(records, file_name):
+    with open(file_name, "w") as f:
+        json.dump(records, f, indent=1, default=_to_builtin)
+
+
+def load(file_name):
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def peak_rss_kb():
+    """Return the peak resident set size (in kB) since the last reset, or of the process
+    """
+    try:
+        with open(_PROC_STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss():
+    """Start a new peak of peak_rss_kb, where the OS allows it
+    """
+    # Linux resets the peak RSS (VmHWM) reported in /proc/self/status when 5 is
+    # written to clear_refs. Elsewhere, peaks are those of the whole process.
+    try:
+        with open(_PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _to_builtin(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value)} is not JSON serializable")
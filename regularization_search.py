@@ -0,0 +1,614 @@
+"""
+Cross-validated searches for the regularization strength of LR Fister deconvolution.
+
+These are alternatives to deconvolvers.LRFisterGrid that need fewer full
+deconvolutions. After fitting, they expose the LRFisterGrid attributes used by
+the pipeline and the figures (best_regularization_strength_, deconvolved_y_,
+reconstruction_y_, ...). Every evaluated strength is recorded, in ascending
+order, in regularization_strengths_ with its mean validation MSE in cv_.
+The cost of the evaluations is kept for profiling, in cv_profile_ or
+cv_results_.
+"""
+
+import numpy as np
+from sklearn.base import BaseEstimator
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV, KFold
+from joblib import Parallel, delayed, effective_n_jobs
+
+from pax_deconvolve.deconvolution import deconvolvers
+import profiling
+import richardson_lucy
+
+SEARCHES = ["grid", "adaptive", "halving", "batched"]
+
+
+def make_cv_deconvolver(
+    search,
+    impulse_response,
+    convolved_x,
+    regularization_strengths,
+    iterations,
+    ground_truth_y,
+    cv_folds=None,
+    dtype=None,
+    acceleration=None,
+    coarse_levels=0,
+    tail_tolerance=None,
+    backend="numpy",
+):
+    """Return a cross-validated deconvolver using the requested search
+
+    For the "adaptive" search, regularization_strengths only sets the range
+    that is searched. If cv_folds is None, the deconvolver's default
+    number of folds is used. See make_deconvolver for dtype, acceleration,
+    coarse_levels, tail_tolerance and backend, which the "grid" search does
+    not support.
+    """
+    kwargs = {} if cv_folds is None else {"cv_folds": cv_folds}
+    if dtype is not None:
+        if search == "grid":
+            raise ValueError(
+                "The grid search only runs in float64, use the adaptive or halving search"
+            )
+        kwargs["dtype"] = dtype
+    if acceleration is not None:
+        if search == "grid":
+            raise ValueError(
+                "The grid search only runs the standard LR update, use another search"
+            )
+        kwargs["acceleration"] = acceleration
+    if coarse_levels:
+        if search == "grid":
+            raise ValueError(
+                "The grid search only runs on the fine grid, use another search"
+            )
+        kwargs["coarse_levels"] = coarse_levels
+    if tail_tolerance is not None:
+        if search == "grid":
+            raise ValueError(
+                "The grid search only convolves the full impulse response, use another search"
+            )
+        kwargs["tail_tolerance"] = tail_tolerance
+    if backend != "numpy":
+        if search == "grid":
+            raise ValueError(
+                "The grid search only runs the numpy backend, use another search"
+            )
+        kwargs["backend"] = backend
+    if search == "grid":
+        return deconvolvers.LRFisterGrid(
+            impulse_response["x"],
+            impulse_response["y"],
+            convolved_x,
+            regularization_strengths,
+            iterations,
+            ground_truth_y,
+            **kwargs,
+        )
+    if search == "adaptive":
+        return AdaptiveLRFisterGrid(
+            impulse_response["x"],
+            impulse_response["y"],
+            convolved_x,
+            (np.amin(regularization_strengths), np.amax(regularization_strengths)),
+            iterations,
+            ground_truth_y,
+            **kwargs,
+        )
+    if search == "halving":
+        return HalvingLRFisterGrid(
+            impulse_response["x"],
+            impulse_response["y"],
+            convolved_x,
+            regularization_strengths,
+            iterations,
+            ground_truth_y,
+            **kwargs,
+        )
+    if search == "batched":
+        return BatchedLRFisterGrid(
+            impulse_response["x"],
+            impulse_response["y"],
+            convolved_x,
+            regularization_strengths,
+            iterations,
+            ground_truth_y,
+            **kwargs,
+        )
+    raise ValueError(
+        f"Unknown regularization search {search}, expected one of {SEARCHES}"
+    )
+
+
+def make_deconvolver(
+    impulse_response_x,
+    impulse_response_y,
+    convolved_x,
+    regularization_strength,
+    iterations,
+    ground_truth_y,
+    dtype=None,
+    acceleration=None,
+    coarse_levels=0,
+    tail_tolerance=None,
+    backend="numpy",
+):
+    """Return an LR Fister deconvolver
+
+    If dtype, acceleration and tail_tolerance are None, coarse_levels is 0 and
+    backend is "numpy", pax_deconvolve's float64 deconvolver is used,
+    otherwise richardson_lucy's separate implementation of the same algorithm
+    (see run_simulations/float32_accuracy.py for how it compares with
+    pax_deconvolve), computing in dtype (e.g. np.float32, float64 if None)
+    with the accelerated update acceleration (one of
+    richardson_lucy.ACCELERATIONS), starting on coarse_levels coarser grids,
+    convolving the tails of the impulse response that are flat to within
+    tail_tolerance as constants and running the update with backend (one of
+    richardson_lucy.BACKENDS).
+    """
+    if (
+        dtype is None
+        and acceleration is None
+        and coarse_levels == 0
+        and tail_tolerance is None
+        and backend == "numpy"
+    ):
+        return deconvolvers.LRFisterDeconvolve(
+            impulse_response_x,
+            impulse_response_y,
+            convolved_x,
+            regularization_strength=regularization_strength,
+            iterations=iterations,
+            ground_truth_y=ground_truth_y,
+        )
+    return richardson_lucy.LRFisterDeconvolve(
+        impulse_response_x,
+        impulse_response_y,
+        convolved_x,
+        regularization_strength=regularization_strength,
+        iterations=iterations,
+        ground_truth_y=ground_truth_y,
+        dtype=np.float64 if dtype is None else dtype,
+        acceleration=acceleration,
+        coarse_levels=coarse_levels,
+        tail_tolerance=tail_tolerance,
+        backend=backend,
+    )
+
+
+class AdaptiveLRFisterGrid(BaseEstimator):
+    """LR Fister deconvolution with a coarse-to-fine search of the regularization strength
+
+    The cross validation error is first evaluated on coarse_points (at least 3)
+    strengths spaced logarithmically over bounds. The minimum is then refined
+    in refine_evaluations steps of successive parabolic interpolation in log of
+    the strength: each step evaluates the minimum of the parabola through the
+    best strength so far and its neighbours, limited to the interval between
+    these neighbours. The refinement stops early when this minimum is within
+    tolerance (in log10 of the strength) of a strength already evaluated.
+
+    The folds of one strength only keep cv_folds workers busy, so each step
+    also evaluates refine_points - 1 strengths evenly dividing the interval
+    between the neighbours, all in one parallel call. If refine_points is
+    None, it is the number of workers of n_jobs divided by cv_folds (at least
+    1), which keeps every worker busy but makes the evaluated strengths depend
+    on the machine; set it to make a search reproducible. With
+    refine_points=1 a step evaluates only the parabola's minimum.
+
+    With the defaults and up to 5 workers, at most 7 strengths are cross
+    validated, against the 10 of the default grid of the pipeline, and the
+    refined strength is not limited to the grid spacing of 0.22 in log10.
+    """
+
+    def __init__(
+        self,
+        impulse_response_x,
+        impulse_response_y,
+        convolved_x,
+        bounds=(1e-3, 1e-1),
+        iterations=1e3,
+        ground_truth_y=None,
+        cv_folds=3,
+        coarse_points=4,
+        refine_evaluations=3,
+        tolerance=0.01,
+        refine_points=None,
+        n_jobs=-1,
+        dtype=None,
+        acceleration=None,
+        coarse_levels=0,
+        tail_tolerance=None,
+        backend="numpy",
+    ):
+        self.impulse_response_x = impulse_response_x
+        self.impulse_response_y = impulse_response_y
+        self.convolved_x = convolved_x
+        self.bounds = bounds
+        self.iterations = iterations
+        self.ground_truth_y = ground_truth_y
+        self.cv_folds = cv_folds
+        self.coarse_points = coarse_points
+        self.refine_evaluations = refine_evaluations
+        self.tolerance = tolerance
+        self.refine_points = refine_points
+        self.n_jobs = n_jobs
+        self.dtype = dtype
+        self.acceleration = acceleration
+        self.coarse_levels = coarse_levels
+        self.tail_tolerance = tail_tolerance
+        self.backend = backend
+
+    def fit(self, X, y=None):
+        X = np.asarray(X)
+        self._folds = list(KFold(n_splits=self.cv_folds).split(X))
+        self._evaluated = {}
+        self.cv_profile_ = []
+        log_coarse = np.linspace(
+            np.log10(self.bounds[0]), np.log10(self.bounds[1]), self.coarse_points
+        )
+        self._evaluate(X, log_coarse)
+        self._refine(X)
+        log_strengths = np.array(sorted(self._evaluated))
+        self.regularization_strengths_ = 10 ** log_strengths
+        self.cv_ = np.array([self._evaluated[i] for i in log_strengths])
+        self.best_regularization_strength_ = self.regularization_strengths_[
+            np.argmin(self.cv_)
+        ]
+        self.best_estimator_ = self._make_deconvolver(
+            self.best_regularization_strength_
+        )
+        self.best_estimator_.fit(X)
+        _copy_best_results(self)
+        del self._folds, self._evaluated
+        return self
+
+    def _refine(self, X):
+        if self.refine_points is None:
+            refine_points = max(1, effective_n_jobs(self.n_jobs) // self.cv_folds)
+        else:
+            refine_points = self.refine_points
+        for _ in range(self.refine_evaluations):
+            log_strengths = np.array(sorted(self._evaluated))
+            cv = np.array([self._evaluated[i] for i in log_strengths])
+            best_ind = np.argmin(cv)
+            lower = log_strengths[max(best_ind - 1, 0)]
+            upper = log_strengths[min(best_ind + 1, len(log_strengths) - 1)]
+            # the parabola through the best point and its neighbours (or the
+            # next two points inwards, at the bounds)
+            first = np.clip(best_ind - 1, 0, len(log_strengths) - 3)
+            curvature, slope, _ = np.polyfit(
+                log_strengths[first : first + 3], cv[first : first + 3], 2
+            )
+            if curvature > 0:
+                log_next = np.clip(-slope / (2 * curvature), lower, upper)
+            else:
+                # no minimum in between, so bisect the wider side
+                best = log_strengths[best_ind]
+                log_next = (
+                    best + (lower if best - lower > upper - best else upper)
+                ) / 2
+            if np.amin(np.abs(log_strengths - log_next)) < self.tolerance:
+                return
+            candidates = [log_next]
+            for log_strength in np.linspace(lower, upper, refine_points + 1)[1:-1]:
+                evaluated = np.concatenate([log_strengths, candidates])
+                if np.amin(np.abs(evaluated - log_strength)) >= self.tolerance:
+                    candidates.append(log_strength)
+            self._evaluate(X, candidates)
+
+    def _evaluate(self, X, log_strengths):
+        """Record the mean validation MSE for strengths not evaluated yet"""
+        log_strengths = [i for i in log_strengths if i not in self._evaluated]
+        results = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fold_score)(self._make_deconvolver(10 ** i), X[train], X[test])
+            for i in log_strengths
+            for train, test in self._folds
+        )
+        scores, records = zip(*results) if results else ([], [])
+        self.cv_profile_.extend(records)
+        scores = np.reshape(scores, (len(log_strengths), len(self._folds)))
+        for log_strength, strength_scores in zip(log_strengths, scores):
+            self._evaluated[log_strength] = -np.mean(strength_scores)
+
+    def _make_deconvolver(self, regularization_strength):
+        return make_deconvolver(
+            self.impulse_response_x,
+            self.impulse_response_y,
+            self.convolved_x,
+            regularization_strength,
+            self.iterations,
+            self.ground_truth_y,
+            self.dtype,
+            self.acceleration,
+            self.coarse_levels,
+            self.tail_tolerance,
+            self.backend,
+        )
+
+
+class HalvingLRFisterGrid(BaseEstimator):
+    """LR Fister deconvolution with a successive-halving search of the regularization strength
+
+    All regularization_strengths are first cross validated with a small number
+    of iterations. Only the best 1/factor of them are kept for the next round,
+    which runs factor times more iterations, until the last round uses (close
+    to) the full number of iterations. Unpromising strengths are therefore
+    dropped early instead of being run for all iterations on every fold.
+
+    cv_ holds the validation MSE of each strength from the last round it
+    reached, with the iterations of that round in iterations_.
+    """
+
+    def __init__(
+        self,
+        impulse_response_x,
+        impulse_response_y,
+        convolved_x,
+        regularization_strengths=np.logspace(-3, -1, 10),
+        iterations=1e3,
+        ground_truth_y=None,
+        cv_folds=3,
+        factor=3,
+        min_iterations="exhaust",
+        n_jobs=-1,
+        dtype=None,
+        acceleration=None,
+        coarse_levels=0,
+        tail_tolerance=None,
+        backend="numpy",
+    ):
+        self.impulse_response_x = impulse_response_x
+        self.impulse_response_y = impulse_response_y
+        self.convolved_x = convolved_x
+        self.regularization_strengths = regularization_strengths
+        self.iterations = iterations
+        self.ground_truth_y = ground_truth_y
+        self.cv_folds = cv_folds
+        self.factor = factor
+        self.min_iterations = min_iterations
+        self.n_jobs = n_jobs
+        self.dtype = dtype
+        self.acceleration = acceleration
+        self.coarse_levels = coarse_levels
+        self.tail_tolerance = tail_tolerance
+        self.backend = backend
+
+    def fit(self, X, y=None):
+        X = np.asarray(X)
+        deconvolver = make_deconvolver(
+            self.impulse_response_x,
+            self.impulse_response_y,
+            self.convolved_x,
+            self.regularization_strengths[0],
+            self.iterations,
+            self.ground_truth_y,
+            self.dtype,
+            self.acceleration,
+            self.coarse_levels,
+            self.tail_tolerance,
+            self.backend,
+        )
+        search = HalvingGridSearchCV(
+            deconvolver,
+            {"regularization_strength": list(self.regularization_strengths)},
+            factor=self.factor,
+            resource="iterations",
+            max_resources=int(self.iterations),
+            min_resources=self.min_iterations,
+            cv=KFold(n_splits=self.cv_folds),
+            n_jobs=self.n_jobs,
+        )
+        search.fit(X)
+        results = search.cv_results_
+        self.cv_results_ = results
+        strengths = np.array(results["param_regularization_strength"], dtype=float)
+        # rows of later rounds come last, so they overwrite earlier rounds here
+        last_rounds = {}
+        for ind, strength in enumerate(strengths):
+            last_rounds[strength] = ind
+        self.regularization_strengths_ = np.array(sorted(last_rounds))
+        last_inds = [last_rounds[i] for i in self.regularization_strengths_]
+        self.cv_ = -results["mean_test_score"][last_inds]
+        self.iterations_ = results["n_resources"][last_inds]
+        self.total_iterations_ = np.sum(results["n_resources"]) * self.cv_folds
+        self.best_regularization_strength_ = search.best_params_[
+            "regularization_strength"
+        ]
+        self.best_estimator_ = search.best_estimator_
+        _copy_best_results(self)
+        return self
+
+
+class BatchedLRFisterGrid(BaseEstimator):
+    """Grid search of the regularization strength, fitting all folds of a strength at once
+
+    The training spectra of all folds are deconvolved together as the rows of
+    one run of richardson_lucy's reimplementation of LR Fister (not
+    pax_deconvolve), so every iteration makes one batched pair of FFT calls
+    for all folds instead of a separate fit per fold. The LR update is not
+    linear in the spectrum, so each fold keeps its own estimate and
+    reconvolution: what the folds share are the transforms of the impulse
+    response, the FFT and smoothing calls and the overhead of the loop. With
+    3 folds, a strength costs about 2 single fits at 1800 points and 1.5 at
+    300 points, against about 3 for separate fits. Validation is scored from
+    the reconstruction of the last iteration (the convolution of the estimate
+    before its update), which the LR update computes anyway: with r the
+    reconstruction and v the mean validation spectrum of a fold, the
+    MSE is mean(r**2) - 2 * mean(r * v) + mean(v**2), where mean(v**2) is
+    computed once, leaving one dot product per fold.
+
+    If checkpoint_every is given, the validation MSE is also recorded every
+    checkpoint_every iterations, in cv_path_ (strengths by checkpoints) with the
+    iterations in checkpoints_. With coarse_levels, checkpoints are only
+    recorded on the fine grid.
+    """
+
+    def __init__(
+        self,
+        impulse_response_x,
+        impulse_response_y,
+        convolved_x,
+        regularization_strengths=np.logspace(-3, -1, 10),
+        iterations=1e3,
+        ground_truth_y=None,
+        cv_folds=3,
+        checkpoint_every=None,
+        n_jobs=-1,
+        dtype=np.float64,
+        acceleration=None,
+        coarse_levels=0,
+        tail_tolerance=None,
+        backend="numpy",
+    ):
+        self.impulse_response_x = impulse_response_x
+        self.impulse_response_y = impulse_response_y
+        self.convolved_x = convolved_x
+        self.regularization_strengths = regularization_strengths
+        self.iterations = iterations
+        self.ground_truth_y = ground_truth_y
+        self.cv_folds = cv_folds
+        self.checkpoint_every = checkpoint_every
+        self.n_jobs = n_jobs
+        self.dtype = dtype
+        self.acceleration = acceleration
+        self.coarse_levels = coarse_levels
+        self.tail_tolerance = tail_tolerance
+        self.backend = backend
+
+    def fit(self, X, y=None):
+        X = np.asarray(X)
+        folds = list(KFold(n_splits=self.cv_folds).split(X))
+        training_y = np.array(
+            [np.mean(X[train], axis=0) for train, _ in folds], dtype=self.dtype
+        )
+        validation_y = np.array(
+            [np.mean(X[test], axis=0) for _, test in folds], dtype=self.dtype
+        )
+        self.regularization_strengths_ = np.sort(self.regularization_strengths)
+        results = Parallel(n_jobs=self.n_jobs)(
+            delayed(_batched_fold_mse)(
+                training_y,
+                validation_y,
+                self.impulse_response_y,
+                strength,
+                np.abs(self.convolved_x[1] - self.convolved_x[0]),
+                self.iterations,
+                self.checkpoint_every,
+                self.acceleration,
+                self.coarse_levels,
+                self.tail_tolerance,
+                self.backend,
+            )
+            for strength in self.regularization_strengths_
+        )
+        fold_mse, checkpoints, paths = zip(*results)
+        self.cv_ = np.mean(fold_mse, axis=1)
+        if self.checkpoint_every is not None:
+            self.checkpoints_ = np.array(checkpoints[0])
+            self.cv_path_ = np.mean(paths, axis=2)
+        self.best_regularization_strength_ = self.regularization_strengths_[
+            np.argmin(self.cv_)
+        ]
+        self.best_estimator_ = richardson_lucy.LRFisterDeconvolve(
+            self.impulse_response_x,
+            self.impulse_response_y,
+            self.convolved_x,
+            regularization_strength=self.best_regularization_strength_,
+            iterations=self.iterations,
+            ground_truth_y=self.ground_truth_y,
+            dtype=self.dtype,
+            acceleration=self.acceleration,
+            coarse_levels=self.coarse_levels,
+            tail_tolerance=self.tail_tolerance,
+            backend=self.backend,
+        )
+        self.best_estimator_.fit(X)
+        _copy_best_results(self)
+        return self
+
+
+def _batched_fold_mse(
+    training_y,
+    validation_y,
+    impulse_response_y,
+    regularization_strength,
+    energy_spacing,
+    iterations,
+    checkpoint_every=None,
+    acceleration=None,
+    coarse_levels=0,
+    tail_tolerance=None,
+    backend="numpy",
+):
+    """Return the validation MSE of each fold, the checkpoint iterations and its path over them
+
+    Rows of training_y and validation_y are the mean training and validation
+    spectra of the folds, deconvolved with richardson_lucy's reimplementation
+    of LR Fister (not pax_deconvolve). The MSE is scored from the last
+    reconstruction passed to the callback, i.e. the convolution of the
+    estimate before the last update, which lr_fister has already computed,
+    instead of convolving the final estimate once more.
+    """
+    validation_square = np.mean(validation_y ** 2, axis=-1)
+
+    def fold_mse(reconstruction):
+        cross = np.einsum("ij,ij->i", reconstruction, validation_y)
+        return (
+            np.mean(reconstruction ** 2, axis=-1)
+            - 2 * cross / validation_y.shape[-1]
+            + validation_square
+        )
+
+    checkpoints = []
+    path = []
+    # the callback is called on every iteration of the fine grid, and every
+    # checkpoint_every-th of them is a checkpoint
+    last = {"reconstruction": None, "fine_iterations": 0}
+
+    def callback(iteration, estimate, reconstruction):
+        last["reconstruction"] = reconstruction
+        if (
+            checkpoint_every is not None
+            and last["fine_iterations"] % checkpoint_every == 0
+        ):
+            checkpoints.append(iteration)
+            path.append(fold_mse(reconstruction))
+        last["fine_iterations"] += 1
+
+    richardson_lucy.lr_fister_coarse_to_fine(
+        training_y,
+        impulse_response_y,
+        regularization_strength,
+        energy_spacing,
+        iterations,
+        coarse_levels,
+        callback=callback,
+        acceleration=acceleration,
+        tail_tolerance=tail_tolerance,
+        backend=backend,
+    )
+    return fold_mse(last["reconstruction"]), checkpoints, path
+
+
+def _copy_best_results(search):
+    """Expose results of the refitted best deconvolver as attributes of a search
+    """
+    search.measured_y_ = search.best_estimator_.measured_y_
+    search.deconvolved_y_ = search.best_estimator_.deconvolved_y_
+    search.reconstruction_y_ = search.best_estimator_.reconstruction_y_
+    search.deconvolved_x = search.best_estimator_.deconvolved_x
+
+
+def _fold_score(deconvolver, X_train, X_test):
+    """Return the validation score of deconvolver and the profile record of the fold
+    """
+    profile = profiling.Profile()
+    with profile.stage(
+        "cv_fold",
+        iterations=int(deconvolver.iterations),
+        regularization_strength=deconvolver.regularization_strength,
+    ):
+        deconvolver.fit(X_train)
+        score = deconvolver.score(X_test)
+    return score, profile.records[0]
@@ -0,0 +1,109 @@
+"""
+Compact summaries of deconvolution results for plotting.
+
+Figures only read a few arrays of the fitted deconvolvers. A summary keeps
+these in DeconvolutionSummary records, saved to an .npz file next to the full
+result: arrays shared by a group of deconvolutions (x-values, ground truth and
+impulse response) are saved once, and the outputs of the deconvolutions as
+rows of 2D arrays. Loading a summary takes milliseconds and a few MB, instead
+of unpickling the full result.
+"""
+
+import numpy as np
+
+# Arrays that are the same for all deconvolutions of a group:
+_SHARED = [
+    "deconvolved_x",
+    "convolved_x",
+    "ground_truth_y",
+    "impulse_response_x",
+    "impulse_response_y",
+]
+# Arrays that differ between deconvolutions:
+_OUTPUTS = ["deconvolved_y_", "measured_y_", "reconstruction_y_"]
+# Separates group and array names in the .npz file
+_SEPARATOR = "__"
+
+
+class DeconvolutionSummary:
+    """The attributes of a fitted deconvolver that are used by the figures
+    """
+
+    __slots__ = _SHARED + _OUTPUTS + ["regularization_strength"]
+
+    def __init__(self, **attributes):
+        for name in self.__slots__:
+            setattr(self, name, attributes.get(name))
+
+
+def save(file_name, groups, **arrays):
+    """Save summaries of groups of fitted deconvolvers, and any further arrays
+
+    groups maps group names to lists of deconvolvers.
+    """
+    shared, rows = to_arrays(groups)
+    np.savez(file_name, **shared, **rows, **arrays)
+
+
+def load(file_name):
+    """Load summaries saved by save
+
+    Returns a dictionary with a list of DeconvolutionSummary for each group and
+    the further arrays.
+    """
+    with np.load(file_name) as data:
+        return from_arrays({name: data[name] for name in data.files})
+
+
+def to_arrays(groups):
+    """Return the arrays summarizing groups of fitted deconvolvers
+
+    Returns the arrays shared by the deconvolutions of each group and the
+    arrays with one row per deconvolution, both keyed by group and name.
+    """
+    shared = {}
+    rows = {}
+    for group, deconvolvers in groups.items():
+        for name in _SHARED:
+            shared[group + _SEPARATOR + name] = getattr(deconvolvers[0], name)
+        outputs = {name: [] for name in _OUTPUTS + ["regularization_strength"]}
+        for deconvolver in deconvolvers:
+            for name in _OUTPUTS:
+                outputs[name].append(getattr(deconvolver, name))
+            outputs["regularization_strength"].append(
+                _get_regularization_strength(deconvolver)
+            )
+        for name, output in outputs.items():
+            rows[group + _SEPARATOR + name] = np.array(output)
+    return shared, rows
+
+
+def from_arrays(arrays):
+    """Return summaries of the groups in arrays from to_arrays, and any further arrays
+    """
+    loaded = {}
+    groups = {}
+    for name, array in arrays.items():
+        if _SEPARATOR in name:
+            group, attribute = name.split(_SEPARATOR, 1)
+            groups.setdefault(group, {})[attribute] = array
+        else:
+            loaded[name] = array
+    for group, attributes in groups.items():
+        loaded[group] = [
+            DeconvolutionSummary(
+                **{name: attributes[name] for name in _SHARED},
+                **{
+                    name: attributes[name][ind]
+                    for name in _OUTPUTS + ["regularization_strength"]
+                },
+            )
+            for ind in range(len(attributes["regularization_strength"]))
+        ]
+    return loaded
+
+
+def _get_regularization_strength(deconvolver):
+    if hasattr(deconvolver, "best_regularization_strength_"):
+        return deconvolver.best_regularization_strength_
+    return deconvolver.regularization_strength
@@ -0,0 +1,596 @@
+"""
+Richardson-Lucy deconvolution with Fister regularization, written with NumPy.
+
+The measured PAX spectrum is modelled as the "valid" convolution of the X-ray
+spectrum with the impulse response. Every iteration applies the
+Richardson-Lucy update and then smooths the estimate with a Gaussian whose
+standard deviation is the regularization strength (in eV), which is the
+regularization of LRFisterDeconvolve. Having the loop here lets us observe and
+modify it, e.g. to record convergence metrics while iterating, to run it in
+single precision and to accelerate it.
+
+Accelerated variants apply every update to an estimate extrapolated along the
+last step, y_k = max(x_k + alpha_k * (x_k - x_(k-1)), 0), where x_k is the
+result of the k-th update:
+- "biggs_andrews" (Biggs & Andrews, Appl. Opt. 36, 1766 (1997)) uses
+  alpha_k = sum(g_k * g_(k-1)) / sum(g_(k-1)**2), clipped to [0, 1], with
+  g_k = x_k - y_(k-1) the change made by the k-th update.
+- "nesterov" uses the momentum alpha_k = (k - 1) / (k + 2), where k counts
+  the iterations since the last restart. The momentum is restarted whenever
+  the update opposes the last step, sum(g_k * (x_k - x_(k-1))) < 0, which
+  keeps the iteration stable over long runs (O'Donoghue & Candes, Found.
+  Comput. Math. 15, 715 (2015)).
+Their iterations take 1.25 to 1.5 times as long as standard ones, mostly in
+the extra vector operations (see ITERATION_COSTS). See
+benchmarks/acceleration.py for the iterations they save.
+"""
+
+import warnings
+import numpy as np
+from scipy import fft
+from scipy.ndimage import convolve1d
+from sklearn.base import BaseEstimator
+
+from pax_deconvolve.deconvolution import deconvolvers
+import lr_kernels
+
+# Smallest value denominators are clipped to, to avoid dividing by zero
+_TINY = 1e-300
+# Points of the adjoint whose weights sum to less than this many machine
+# epsilons of the largest sum, which keeps the rounding errors of the FFTs at
+# the other points below about 1e-6 of their values, but at most
+# _DIRECT_EDGE_FRACTION of it, which bounds their number in single precision,
+# are computed as direct sums
+_DIRECT_EDGE_EPS = 1e6
+_DIRECT_EDGE_FRACTION = 1e-3
+# Values of the acceleration argument of lr_fister
+ACCELERATIONS = [None, "biggs_andrews", "nesterov"]
+# Values of the backend argument of lr_fister
+BACKENDS = ["numpy", "numba"]
+# Time of an iteration of each update relative to a standard one, measured
+# with lr_fister on 1800 (1.28 and 1.25) and 300 points (1.49 and 1.34)
+ITERATION_COSTS = {None: 1.0, "biggs_andrews": 1.4, "nesterov": 1.3}
+
+
+def lr_fister(
+    measured_y,
+    impulse_response_y,
+    regularization_strength,
+    energy_spacing,
+    iterations,
+    initial_y=None,
+    callback=None,
+    callback_every=1,
+    acceleration=None,
+    tail_tolerance=None,
+    backend="numpy",
+):
+    """Return the LR Fister deconvolution of measured_y
+
+    measured_y may also be a 2D array, in which case each row is deconvolved
+    independently. The deconvolution is computed in the floating point
+    precision of measured_y (float64 for integer input). If given,
+    callback(iteration, estimate, reconstruction) is called every
+    callback_every iterations with the current estimate and its convolution
+    with the impulse response (with acceleration, the extrapolated estimate
+    that the update is applied to). acceleration is one of ACCELERATIONS. If
+    given, flat tails of the impulse response are convolved as constants (see
+    ConvolutionOperator). With backend="numba", the element-wise steps of the
+    update run in the compiled kernels of lr_kernels, writing into
+    preallocated arrays (with a warning and NumPy if Numba is not installed).
+    The estimate passed to the callback may then be overwritten by the next
+    iteration.
+    """
+    if acceleration not in ACCELERATIONS:
+        raise ValueError(
+            f"Unknown acceleration {acceleration}, expected one of {ACCELERATIONS}"
+        )
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+    if backend == "numba" and not lr_kernels.AVAILABLE:
+        warnings.warn("Numba is not installed, using the numpy backend")
+        backend = "numpy"
+    measured_y = np.asarray(measured_y)
+    if not np.issubdtype(measured_y.dtype, np.floating):
+        measured_y = measured_y.astype(float)
+    dtype = measured_y.dtype
+    tiny = max(_TINY, np.finfo(dtype).tiny)
+    operator = ConvolutionOperator(
+        impulse_response_y,
+        np.shape(measured_y)[-1],
+        dtype=dtype,
+        tail_tolerance=tail_tolerance,
+    )
+    smoothing_kernel = gaussian_kernel(regularization_strength / energy_spacing)
+    smoothing_kernel = smoothing_kernel.astype(dtype)
+    if initial_y is None:
+        estimate = flat_estimate(measured_y, impulse_response_y).astype(dtype)
+    else:
+        estimate = np.array(initial_y, dtype=dtype)
+    normalization = np.maximum(
+        operator.adjoint(np.ones(operator.convolved_length, dtype=dtype)), tiny
+    )
+    # With acceleration, estimate is the extrapolated estimate the update is
+    # applied to and updated the result of the update
+    updated = estimate
+    change = None
+    momentum_iterations = np.zeros(np.shape(measured_y)[:-1] + (1,))
+    if backend == "numba":
+        # buffers of the update, allocated once. With acceleration, the
+        # updates alternate between two buffers, as the previous one is
+        # still needed.
+        ratio = np.empty_like(measured_y)
+        work = lr_kernels.work_buffer(len(normalization), smoothing_kernel, dtype)
+        updated_buffers = [np.empty_like(estimate) for _ in range(2)]
+    for iteration in range(int(iterations)):
+        reconstruction = operator.forward(estimate)
+        if (callback is not None) and (iteration % callback_every == 0):
+            callback(iteration, estimate, reconstruction)
+        previous = updated
+        if backend == "numba":
+            # a fused kernel is no faster than these two in-place calls
+            np.divide(
+                measured_y, np.maximum(reconstruction, tiny, out=ratio), out=ratio
+            )
+            updated = lr_kernels.update(
+                estimate,
+                operator.adjoint(ratio),
+                normalization,
+                smoothing_kernel,
+                work,
+                # without acceleration, the estimate is not needed afterwards
+                estimate if acceleration is None else updated_buffers[iteration % 2],
+            )
+        else:
+            ratio = measured_y / np.maximum(reconstruction, tiny)
+            updated = estimate * (operator.adjoint(ratio) / normalization)
+            updated = convolve1d(updated, smoothing_kernel, axis=-1, mode="constant")
+        if acceleration is None:
+            estimate = updated
+            continue
+        previous_change = change
+        change = updated - estimate
+        if acceleration == "biggs_andrews":
+            if previous_change is None:
+                estimate = updated
+                continue
+            alpha = _row_sum(change * previous_change) / np.maximum(
+                _row_sum(previous_change ** 2), tiny
+            )
+            alpha = np.clip(alpha, 0, 1)
+        else:
+            momentum_iterations += 1
+            momentum_iterations[_row_sum(change * (updated - previous)) < 0] = 0
+            alpha = np.maximum(momentum_iterations - 1, 0) / (momentum_iterations + 2)
+        estimate = np.maximum(updated + alpha.astype(dtype) * (updated - previous), 0)
+    return updated
+
+
+def _row_sum(y):
+    return np.sum(y, axis=-1, keepdims=True)
+
+
+def lr_fister_coarse_to_fine(
+    measured_y,
+    impulse_response_y,
+    regularization_strength,
+    energy_spacing,
+    iterations,
+    coarse_levels=1,
+    coarse_fraction=0.5,
+    callback=None,
+    callback_every=1,
+    acceleration=None,
+    tail_tolerance=None,
+    backend="numpy",
+):
+    """Return the LR Fister deconvolution of measured_y, starting on coarser grids
+
+    coarse_fraction of the iterations are run on a grid with twice the energy
+    spacing, on which measured_y is averaged over pairs of points and the
+    impulse response summed over pairs of points. Its result, interpolated to
+    the fine grid, is the starting estimate of the remaining iterations. The
+    coarse grid is itself started from a coarser grid, up to coarse_levels
+    times, so e.g. with 2 coarse levels and a coarse_fraction of 0.5, a quarter
+    of the iterations are run on each coarse grid, at a half and a quarter of
+    the cost. With coarse_levels=0, this is lr_fister.
+
+    The other arguments are those of lr_fister. The callback is only called on
+    the fine grid, with iterations counted from the start on the coarsest grid.
+    """
+    measured_y = np.asarray(measured_y)
+    if (
+        coarse_levels == 0
+        or np.shape(measured_y)[-1] < 4
+        or len(impulse_response_y) < 2
+    ):
+        return lr_fister(
+            measured_y,
+            impulse_response_y,
+            regularization_strength,
+            energy_spacing,
+            iterations,
+            callback=callback,
+            callback_every=callback_every,
+            acceleration=acceleration,
+            tail_tolerance=tail_tolerance,
+            backend=backend,
+        )
+    coarse_iterations = int(int(iterations) * coarse_fraction)
+    coarse_impulse_response_y = _sum_pairs(np.append(impulse_response_y, 0))
+    coarse_y = lr_fister_coarse_to_fine(
+        _sum_pairs(measured_y) / 2,
+        coarse_impulse_response_y,
+        regularization_strength,
+        2 * energy_spacing,
+        coarse_iterations,
+        coarse_levels - 1,
+        coarse_fraction,
+        acceleration=acceleration,
+        tail_tolerance=tail_tolerance,
+        backend=backend,
+    )
+    fine_callback = None
+    if callback is not None:
+
+        def fine_callback(iteration, estimate, reconstruction):
+            callback(coarse_iterations + iteration, estimate, reconstruction)
+
+    return lr_fister(
+        measured_y,
+        impulse_response_y,
+        regularization_strength,
+        energy_spacing,
+        int(iterations) - coarse_iterations,
+        initial_y=_upsample(
+            coarse_y,
+            np.shape(measured_y)[-1] + len(impulse_response_y) - 1,
+            len(impulse_response_y) % 2,
+        ),
+        callback=fine_callback,
+        callback_every=callback_every,
+        acceleration=acceleration,
+        tail_tolerance=tail_tolerance,
+        backend=backend,
+    )
+
+
+def equivalent_iterations(
+    iterations, coarse_levels=0, acceleration=None, coarse_fraction=0.5
+):
+    """Return the cost of lr_fister_coarse_to_fine in standard iterations on the fine grid
+
+    Iterations on a coarse grid cost half of those on the next finer grid, and
+    accelerated iterations ITERATION_COSTS[acceleration] standard ones.
+    """
+    if coarse_levels == 0:
+        return ITERATION_COSTS[acceleration] * int(iterations)
+    coarse_iterations = int(int(iterations) * coarse_fraction)
+    coarse_cost = equivalent_iterations(
+        coarse_iterations, coarse_levels - 1, acceleration, coarse_fraction
+    )
+    fine_cost = ITERATION_COSTS[acceleration] * (int(iterations) - coarse_iterations)
+    return fine_cost + coarse_cost / 2
+
+
+def _sum_pairs(y):
+    """Return the sums of pairs of points along the last axis, dropping an odd last point
+    """
+    y = np.asarray(y)
+    pairs = np.shape(y)[-1] // 2
+    return y[..., : 2 * pairs : 2] + y[..., 1 : 2 * pairs : 2]
+
+
+def _upsample(coarse_y, length, offset):
+    """Return coarse_y linearly interpolated to a grid with half the spacing
+
+    Point i of coarse_y is at point 2 * i + 1 - offset of the fine grid, which
+    has length points, and the end points are extended as constants.
+    """
+    positions = (np.arange(length) - 1 + offset) / 2
+    lower = np.clip(np.floor(positions).astype(int), 0, np.shape(coarse_y)[-1] - 2)
+    weight = np.clip(positions - lower, 0, 1)
+    return coarse_y[..., lower] * (1 - weight) + coarse_y[..., lower + 1] * weight
+
+
+def flat_estimate(measured_y, impulse_response_y):
+    """Return a flat starting estimate with the flux of measured_y
+    """
+    deconvolved_length = np.shape(measured_y)[-1] + len(impulse_response_y) - 1
+    level = np.mean(measured_y, axis=-1, keepdims=True) / np.sum(impulse_response_y)
+    return level * np.ones(deconvolved_length)
+
+
+def gaussian_kernel(sigma):
+    """Return a normalized Gaussian kernel with standard deviation sigma (in points)
+    """
+    half_width = int(np.ceil(4 * sigma))
+    points = np.arange(-half_width, half_width + 1)
+    kernel = np.exp(-0.5 * (points / max(sigma, _TINY)) ** 2)
+    return kernel / np.sum(kernel)
+
+
+class ConvolutionOperator:
+    """Valid-mode convolution with an impulse response and its adjoint, via FFTs
+
+    The transforms of the impulse response are computed once, so every
+    application costs one forward and one inverse real FFT. Both methods work
+    along the last axis, so 2D arrays are transformed row by row. With dtype
+    np.float32, the transforms are computed in single precision. The rounding
+    errors of the FFTs scale with the largest values, so the adjoint at the
+    edge points that only see the vanishing tails of the impulse response is
+    computed as direct sums.
+
+    If tail_tolerance is given, the tails of the impulse response that stay
+    within tail_tolerance * max(abs(impulse_response_y)) of its end values are
+    treated as constants at these values, e.g. the flat background that
+    padded impulse responses are extended with (a tail_tolerance of 0 only
+    takes exactly constant tails). The convolution with a constant tail is a
+    moving sum, computed from cumulative sums, so the FFTs only need to cover
+    the remaining core of the impulse response, which shortens them by the
+    length of the tails.
+    """
+
+    def __init__(
+        self, impulse_response_y, convolved_length, dtype=float, tail_tolerance=None
+    ):
+        self.impulse_response_y = np.asarray(impulse_response_y, dtype=dtype)
+        self.convolved_length = convolved_length
+        self.deconvolved_length = convolved_length + len(impulse_response_y) - 1
+        length = len(self.impulse_response_y)
+        if tail_tolerance is None:
+            self.core_start, self.core_stop = 0, length
+        else:
+            self.core_start, self.core_stop = flat_tails(
+                self.impulse_response_y, tail_tolerance
+            )
+        self.left_value = self.impulse_response_y[0]
+        self.right_value = self.impulse_response_y[-1]
+        core = self.impulse_response_y[self.core_start : self.core_stop]
+        # the core only sees the _seen_length deconvolved points from
+        # _core_offset on, which the FFTs are long enough for
+        self._core_offset = length - self.core_stop
+        self._seen_length = convolved_length + len(core) - 1
+        self._fft_length = fft.next_fast_len(self._seen_length, real=True)
+        self._impulse_response_fft = fft.rfft(core, self._fft_length)
+        self._flipped_fft = fft.rfft(core[::-1], self._fft_length)
+        # the direct sums at the edges use the impulse response with the flat
+        # tails that the FFTs and moving sums convolve with
+        tails = self.impulse_response_y.copy()
+        tails[: self.core_start] = self.left_value
+        tails[self.core_stop :] = self.right_value
+        self._left_edge, self._right_edge = _edge_matrices(
+            tails,
+            convolved_length,
+            min(_DIRECT_EDGE_EPS * np.finfo(dtype).eps, _DIRECT_EDGE_FRACTION),
+        )
+
+    def forward(self, deconvolved_y):
+        """Return the valid convolution of deconvolved_y with the impulse response
+        """
+        length = len(self.impulse_response_y)
+        core_length = self.core_stop - self.core_start
+        seen = deconvolved_y[
+            ..., self._core_offset : self._core_offset + self._seen_length
+        ]
+        full = fft.irfft(
+            fft.rfft(seen, self._fft_length, axis=-1) * self._impulse_response_fft,
+            self._fft_length,
+            axis=-1,
+        )
+        convolved_y = full[
+            ..., core_length - 1 : core_length - 1 + self.convolved_length
+        ]
+        if self.core_start == 0 and self._core_offset == 0:
+            return convolved_y
+        # the tails add moving sums, differences of slices of the cumulative sums
+        cumulative = np.zeros(
+            np.shape(deconvolved_y)[:-1] + (self.deconvolved_length + 1,),
+            dtype=convolved_y.dtype,
+        )
+        np.cumsum(deconvolved_y, axis=-1, out=cumulative[..., 1:])
+        stop = self.convolved_length
+        if self.core_start > 0:
+            convolved_y += self.left_value * (
+                cumulative[..., length : length + stop]
+                - cumulative[
+                    ..., length - self.core_start : length - self.core_start + stop
+                ]
+            )
+        if self._core_offset > 0:
+            convolved_y += self.right_value * (
+                cumulative[..., self._core_offset : self._core_offset + stop]
+                - cumulative[..., :stop]
+            )
+        return convolved_y
+
+    def adjoint(self, convolved_y):
+        """Return the full convolution of convolved_y with the reversed impulse response
+        """
+        full = fft.irfft(
+            fft.rfft(convolved_y, self._fft_length, axis=-1) * self._flipped_fft,
+            self._fft_length,
+            axis=-1,
+        )
+        if self.core_start == 0 and self._core_offset == 0:
+            return self._add_direct_edges(
+                convolved_y, full[..., : self.deconvolved_length]
+            )
+        length = len(self.impulse_response_y)
+        deconvolved_y = np.zeros(
+            np.shape(convolved_y)[:-1] + (self.deconvolved_length,), dtype=full.dtype
+        )
+        deconvolved_y[
+            ..., self._core_offset : self._core_offset + self._seen_length
+        ] = full[..., : self._seen_length]
+        # cumulative sums of convolved_y padded with length - 1 zeros on both
+        # sides, so that the tails' moving sums are differences of its slices
+        cumulative = np.zeros(
+            np.shape(convolved_y)[:-1] + (self.convolved_length + 2 * length,),
+            dtype=full.dtype,
+        )
+        np.cumsum(
+            convolved_y,
+            axis=-1,
+            out=cumulative[..., length : length + self.convolved_length],
+        )
+        cumulative[..., length + self.convolved_length :] = cumulative[
+            ..., length + self.convolved_length - 1 : length + self.convolved_length
+        ]
+        stop = self.deconvolved_length
+        if self.core_start > 0:
+            deconvolved_y += self.left_value * (
+                cumulative[..., self.core_start : self.core_start + stop]
+                - cumulative[..., :stop]
+            )
+        if self._core_offset > 0:
+            deconvolved_y += self.right_value * (
+                cumulative[..., length : length + stop]
+                - cumulative[..., self.core_stop : self.core_stop + stop]
+            )
+        return self._add_direct_edges(convolved_y, deconvolved_y)
+
+    def _add_direct_edges(self, convolved_y, deconvolved_y):
+        """Overwrite the edge points of the adjoint deconvolved_y with direct sums
+        """
+        left = len(self._left_edge)
+        if left > 0:
+            deconvolved_y[..., :left] = (
+                convolved_y[..., : self._left_edge.shape[1]] @ self._left_edge.T
+            )
+        right = len(self._right_edge)
+        if right > 0:
+            deconvolved_y[..., -right:] = (
+                convolved_y[..., -self._right_edge.shape[1] :] @ self._right_edge.T
+            )
+        return deconvolved_y
+
+
+def _edge_matrices(impulse_response_y, convolved_length, tolerance):
+    """Return the matrices of the adjoint at its leading and trailing edge points
+
+    The edge points are those whose weights, the absolute values of the
+    impulse response that see the convolved points, sum to less than tolerance
+    of the largest sum. The leading edge points only see as many of the first
+    convolved points as there are of them, and the trailing ones as many of
+    the last.
+    """
+    flipped = np.asarray(impulse_response_y)[::-1]
+    weights = np.convolve(np.ones(convolved_length), np.abs(flipped).astype(float))
+    small = weights < tolerance * np.amax(weights)
+    left = np.argmin(small)
+    right = np.argmin(small[::-1])
+    deconvolved_length = len(weights)
+    left_matrix = _adjoint_matrix(
+        flipped, np.arange(left), np.arange(min(left, convolved_length))
+    )
+    right_matrix = _adjoint_matrix(
+        flipped,
+        np.arange(deconvolved_length - right, deconvolved_length),
+        np.arange(max(convolved_length - right, 0), convolved_length),
+    )
+    return left_matrix, right_matrix
+
+
+def _adjoint_matrix(flipped, points, seen):
+    """Return the weights of the seen convolved points in the adjoint at points
+    """
+    lags = points[:, np.newaxis] - seen
+    inside = (lags >= 0) & (lags < len(flipped))
+    weights = flipped[np.clip(lags, 0, len(flipped) - 1)]
+    return np.where(inside, weights, 0).astype(flipped.dtype)
+
+
+def flat_tails(impulse_response_y, tolerance):
+    """Return the start and stop of the core of impulse_response_y between flat tails
+
+    The tails are the leading and trailing points within
+    tolerance * max(abs(impulse_response_y)) of the first and last point. The
+    core keeps at least one point.
+    """
+    impulse_response_y = np.asarray(impulse_response_y)
+    scale = tolerance * np.amax(np.abs(impulse_response_y))
+    left_flat = np.abs(impulse_response_y - impulse_response_y[0]) <= scale
+    right_flat = np.abs(impulse_response_y - impulse_response_y[-1]) <= scale
+    if np.all(left_flat) or np.all(right_flat):
+        return 0, len(impulse_response_y)
+    start = np.argmin(left_flat)
+    stop = len(impulse_response_y) - np.argmin(right_flat[::-1])
+    if stop <= start:
+        return 0, len(impulse_response_y)
+    return int(start), int(stop)
+
+
+class LRFisterDeconvolve(BaseEstimator):
+    """LR Fister deconvolution of the mean of PAX spectra, computed with lr_fister
+
+    Has the parameters, attributes and score of
+    deconvolvers.LRFisterDeconvolve, and can also be fitted in single precision
+    by setting dtype to np.float32, with an accelerated update by setting
+    acceleration (one of ACCELERATIONS, see lr_fister), starting on coarser
+    grids by setting coarse_levels (see lr_fister_coarse_to_fine) and
+    convolving flat tails of the impulse response as constants by setting
+    tail_tolerance (see ConvolutionOperator). backend selects the
+    implementation of the update (one of BACKENDS, see lr_fister).
+    """
+
+    def __init__(
+        self,
+        impulse_response_x,
+        impulse_response_y,
+        convolved_x,
+        regularization_strength=0.05,
+        iterations=1e3,
+        ground_truth_y=None,
+        dtype=np.float64,
+        acceleration=None,
+        coarse_levels=0,
+        coarse_fraction=0.5,
+        tail_tolerance=None,
+        backend="numpy",
+    ):
+        self.impulse_response_x = impulse_response_x
+        self.impulse_response_y = impulse_response_y
+        self.convolved_x = convolved_x
+        self.regularization_strength = regularization_strength
+        self.iterations = iterations
+        self.ground_truth_y = ground_truth_y
+        self.dtype = dtype
+        self.acceleration = acceleration
+        self.coarse_levels = coarse_levels
+        self.coarse_fraction = coarse_fraction
+        self.tail_tolerance = tail_tolerance
+        self.backend = backend
+
+    def fit(self, X, y=None):
+        self.deconvolved_x = deconvolvers._get_deconvolved_x(
+            self.convolved_x, self.impulse_response_x
+        )
+        self.measured_y_ = np.mean(X, axis=0, dtype=self.dtype)
+        energy_spacing = np.abs(self.convolved_x[1] - self.convolved_x[0])
+        self.deconvolved_y_ = lr_fister_coarse_to_fine(
+            self.measured_y_,
+            self.impulse_response_y,
+            self.regularization_strength,
+            energy_spacing,
+            self.iterations,
+            self.coarse_levels,
+            self.coarse_fraction,
+            acceleration=self.acceleration,
+            tail_tolerance=self.tail_tolerance,
+            backend=self.backend,
+        )
+        operator = ConvolutionOperator(
+            self.impulse_response_y,
+            len(self.measured_y_),
+            dtype=self.dtype,
+            tail_tolerance=self.tail_tolerance,
+        )
+        self.reconstruction_y_ = operator.forward(self.deconvolved_y_)
+        return self
+
+    def score(self, X, y=None):
+        """Return the negative MSE of the reconstruction from the mean of X
+        """
+        validation_y = np.mean(X, axis=0, dtype=self.dtype)
+        return -np.mean((self.reconstruction_y_ - validation_y) ** 2)
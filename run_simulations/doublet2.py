@@ -1,18 +1,33 @@
 """Run doublet simulations with independently set peak width and peak separation
+
+The constants below are the defaults of run_set; sweeps over other values are
+defined in sweeps/doublet2.toml and run with sweep_spec.
 """
 
+import inspect
+from joblib import effective_n_jobs
 import numpy as np
+import os
 import random
 import pickle
 
-from pax_deconvolve.deconvolution import deconvolvers
-from pax_deconvolve.pax_simulations import simulate_pax
+import model_registry
+import regularization_search
+import result_summary
+import richardson_lucy
+import sweep
+import work_queue
 
 LOG10_COUNTS_LIST = [5.0]
 SEPARATIONS = [0.025, 0.045, 0.07]
 NUM_SIMULATIONS = 3
 NUM_BOOTSTRAPS = 3
 ITERATIONS = 1e5  # use 1e5 for real simulations
+REGULARIZATION_STRENGTHS = np.logspace(-4, -2, 10)
+# absolute, so that work_queue workers started in any directory save here
+RESULTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simulated_results"
+)
 
 
 def load():
@@ -23,42 +38,108 @@ def load():
     return data_list
 
 
-def load_set(separation, log10_counts):
-    file_name = (
-        "simulated_results/doublet2_"
-        + str(separation)
-        + "_"
-        + str(log10_counts)
-        + ".pickle"
-    )
+def load_set(separation, log10_counts, **options):
+    """Load a set saved by run_set, run with the given options of run_set
+    """
+    file_name = _get_filename(separation, log10_counts, **options)
     with open(file_name, "rb") as f:
         data = pickle.load(f)
     return data
 
 
-def run():
+def load_summary():
+    """Load compact summaries of the sets of load, for plotting
+    """
+    return [
+        load_set_summary(separation, LOG10_COUNTS_LIST[0]) for separation in SEPARATIONS
+    ]
+
+
+def load_set_summary(separation, log10_counts, **options):
+    """Load the compact summary of a set, with the keys of load_set
+
+    The summary is made from the full set if it was not saved with it.
+    """
+    file_name = _get_summary_filename(separation, log10_counts, **options)
+    try:
+        summary = result_summary.load(file_name)
+    except FileNotFoundError:
+        _save_summary(load_set(separation, log10_counts, **options), file_name)
+        summary = result_summary.load(file_name)
+    summary["ground_truth"] = {
+        "x": summary.pop("ground_truth_x"),
+        "y": summary.pop("ground_truth_y"),
+    }
+    return summary
+
+
+def run(search="grid", acceleration=None, coarse_levels=0):
     for separation in SEPARATIONS:
         for log10_counts in LOG10_COUNTS_LIST:
-            run_set(separation, log10_counts)
+            run_set(
+                separation,
+                log10_counts,
+                search,
+                acceleration=acceleration,
+                coarse_levels=coarse_levels,
+            )
 
 
-def run_set(separation, log10_counts):
+def enqueue(queue_dir, search="grid", acceleration=None, coarse_levels=0):
+    """Queue the sets of run for work_queue workers
+    """
+    units = [
+        {"separation": separation, "log10_counts": log10_counts, "search": search}
+        for separation in SEPARATIONS
+        for log10_counts in LOG10_COUNTS_LIST
+    ]
+    # only set if given, to keep the keys of units queued without them
+    for unit in units:
+        if acceleration is not None:
+            unit["acceleration"] = acceleration
+        if coarse_levels:
+            unit["coarse_levels"] = coarse_levels
+    store = sweep.ResultStore(os.path.abspath(os.path.join(queue_dir, "results")))
+    work_queue.enqueue(run_set, units, store, queue_dir)
+
+
+def run_set(
+    separation,
+    log10_counts,
+    search="grid",
+    num_simulations=NUM_SIMULATIONS,
+    num_bootstraps=NUM_BOOTSTRAPS,
+    iterations=ITERATIONS,
+    acceleration=None,
+    coarse_levels=0,
+):
+    """Run and save simulations and bootstraps of one doublet, returning the (absolute) file name
+
+    The file name encodes all arguments that differ from their defaults, so
+    sets run with different options do not overwrite each other.
+    acceleration selects an accelerated LR update, which needs fewer
+    iterations, and coarse_levels > 0 starts the deconvolutions on coarser
+    energy grids (see regularization_search.make_deconvolver). Neither is
+    supported by the "grid" search.
+    """
     deconvolved_list = []
-    for i in range(NUM_SIMULATIONS):
-        impulse_response, pax_spectra, xray_xy = simulate_pax.simulate_from_presets(
+    for i in range(num_simulations):
+        impulse_response, pax_spectra, xray_xy = model_registry.simulate_from_presets(
             log10_counts,
             ["i_doublet", separation],
             "fermi",
             1000,
             np.arange(-0.2, 0.4, 0.002),
         )
-        deconvolver = deconvolvers.LRFisterGrid(
-            impulse_response["x"],
-            impulse_response["y"],
+        deconvolver = regularization_search.make_cv_deconvolver(
+            search,
+            impulse_response,
             pax_spectra["x"],
-            np.logspace(-4, -2, 10),
-            ITERATIONS,
+            REGULARIZATION_STRENGTHS,
+            iterations,
             xray_xy["y"],
+            acceleration=acceleration,
+            coarse_levels=coarse_levels,
         )
         _ = deconvolver.fit(np.array(pax_spectra["y"]))
         deconvolved_list.append(deconvolver)
@@ -70,37 +151,87 @@ def run_set(separation, log10_counts):
         pax_spectra,
         xray_xy,
         deconvolver.best_regularization_strength_,
+        num_bootstraps,
+        iterations,
+        acceleration,
+        coarse_levels,
     )
     to_save = {
         "deconvolved": deconvolved_list,
         "bootstraps": bootstrap_results,
         "ground_truth": xray_xy,
     }
-    file_name = (
-        "simulated_results/doublet2_"
-        + str(separation)
-        + "_"
-        + str(log10_counts)
-        + ".pickle"
-    )
+    options = {
+        "search": search,
+        "num_simulations": num_simulations,
+        "num_bootstraps": num_bootstraps,
+        "iterations": iterations,
+        "acceleration": acceleration,
+        "coarse_levels": coarse_levels,
+    }
+    file_name = _get_filename(separation, log10_counts, **options)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
     with open(file_name, "wb") as f:
         pickle.dump(to_save, f)
+    _save_summary(to_save, _get_summary_filename(separation, log10_counts, **options))
+    return file_name
+
 
+def estimate_iterations(
+    separation,
+    log10_counts,
+    search="grid",
+    num_simulations=NUM_SIMULATIONS,
+    num_bootstraps=NUM_BOOTSTRAPS,
+    iterations=ITERATIONS,
+    acceleration=None,
+    coarse_levels=0,
+):
+    """Return the approximate cost of run_set in standard LR iterations
 
-def _run_bootstraps(impulse_response, pax_spectra, xray_xy, regularization_strength):
+    Assumes 3 CV folds, and counts the halving search like the grid search,
+    so it is an upper bound for it. Iterations on coarse grids and accelerated
+    iterations are counted by their cost (see
+    richardson_lucy.equivalent_iterations).
+    """
+    if search == "adaptive":
+        # default coarse_points and refine_evaluations steps of the default
+        # refine_points on this machine, at most
+        num_strengths = 4 + 3 * max(1, effective_n_jobs(-1) // 3)
+    else:
+        num_strengths = len(REGULARIZATION_STRENGTHS)
+    deconvolution = richardson_lucy.equivalent_iterations(
+        iterations, coarse_levels, acceleration
+    )
+    cv_iterations = (num_strengths * 3 + 1) * deconvolution
+    return num_simulations * cv_iterations + num_bootstraps * deconvolution
+
+
+def _run_bootstraps(
+    impulse_response,
+    pax_spectra,
+    xray_xy,
+    regularization_strength,
+    num_bootstraps=NUM_BOOTSTRAPS,
+    iterations=ITERATIONS,
+    acceleration=None,
+    coarse_levels=0,
+):
     bootstrap_deconvolved_list = []
-    for _ in range(NUM_BOOTSTRAPS):
+    for _ in range(num_bootstraps):
         bootstrapped_pax = {
             "x": pax_spectra["x"],
             "y": bootstrap_pax_set(pax_spectra["y"]),
         }
-        deconvolver = deconvolvers.LRFisterDeconvolve(
+        deconvolver = regularization_search.make_deconvolver(
             impulse_response["x"],
             impulse_response["y"],
             bootstrapped_pax["x"],
             regularization_strength,
-            ITERATIONS,
+            iterations,
             xray_xy["y"],
+            acceleration=acceleration,
+            coarse_levels=coarse_levels,
         )
         _ = deconvolver.fit(np.array(bootstrapped_pax["y"]))
         bootstrap_deconvolved_list.append(deconvolver)
@@ -111,3 +242,50 @@ def _run_bootstraps(impulse_response, pax_spectra, xray_xy, regularization_stren
 def bootstrap_pax_set(pax_spectra_y):
     bootstrapped_y = random.choices(pax_spectra_y, k=len(pax_spectra_y))
     return bootstrapped_y
+
+
+def _save_summary(data, file_name):
+    result_summary.save(
+        file_name,
+        {"deconvolved": data["deconvolved"], "bootstraps": data["bootstraps"]},
+        ground_truth_x=data["ground_truth"]["x"],
+        ground_truth_y=data["ground_truth"]["y"],
+    )
+
+
+def _get_filename(separation, log10_counts, **options):
+    return os.path.join(
+        RESULTS_DIR,
+        "doublet2_"
+        + str(separation)
+        + "_"
+        + str(log10_counts)
+        + _get_options_suffix(options)
+        + ".pickle",
+    )
+
+
+def _get_summary_filename(separation, log10_counts, **options):
+    return os.path.join(
+        RESULTS_DIR,
+        "doublet2_"
+        + str(separation)
+        + "_"
+        + str(log10_counts)
+        + _get_options_suffix(options)
+        + "_summary.npz",
+    )
+
+
+def _get_options_suffix(options):
+    """Return the part of file names encoding the run_set options that are not defaults
+    """
+    parameters = inspect.signature(run_set).parameters
+    changed = {
+        name: value
+        for name, value in options.items()
+        if value != parameters[name].default
+    }
+    if not changed:
+        return ""
+    return "_" + sweep.unit_key(changed)
@@ -1,10 +1,19 @@
 """Running PAX simulations with Schlappa model RIXS and Ag converter
 """
 
+import os
+
 from manuscript_plots import schlappa_performance
 import pax_simulation_pipeline
+import richardson_lucy
+import sweep
+import work_queue
 
 SCHLAPPA_PARAMETERS = schlappa_performance.SCHLAPPA_PARAMETERS
+# arguments of run_single that the names of its output files encode, the only
+# ones sweep specs may vary (units differing in others would overwrite each
+# other's results)
+FILE_NAME_PARAMETERS = ["log10_num_electrons"]
 
 
 def run_simulations():
@@ -13,11 +22,57 @@ def run_simulations():
     """
     print("Running Schlappa RIXS, Ag converter simulations")
     for log10_num_electrons in schlappa_performance.LOG10_COUNTS_LIST:
-        _ = pax_simulation_pipeline.run(
-            log10_num_electrons,
-            rixs="schlappa",
-            photoemission="ag",
-            num_additional=25,
-            **SCHLAPPA_PARAMETERS
-        )
+        _ = run_single(log10_num_electrons)
         print("Completed " + str(log10_num_electrons))
+
+
+def enqueue_simulations(queue_dir):
+    """Queue the simulations of run_simulations for work_queue workers
+    """
+    units = [
+        {"log10_num_electrons": log10_num_electrons}
+        for log10_num_electrons in schlappa_performance.LOG10_COUNTS_LIST
+    ]
+    store = sweep.ResultStore(os.path.abspath(os.path.join(queue_dir, "results")))
+    work_queue.enqueue(run_single, units, store, queue_dir)
+
+
+def run_single(log10_num_electrons, num_additional=25, **parameters):
+    """Run and save the simulation of one number of electrons, returning its profile
+
+    parameters override SCHLAPPA_PARAMETERS.
+    """
+    to_save = pax_simulation_pipeline.run(
+        log10_num_electrons,
+        rixs="schlappa",
+        photoemission="ag",
+        num_additional=num_additional,
+        **_get_parameters(parameters)
+    )
+    return to_save["profile"]
+
+
+def estimate_iterations(log10_num_electrons, num_additional=25, **parameters):
+    """Return the approximate cost of run_single in standard LR iterations
+
+    Counts the adaptive and halving searches like the grid search, so it is an
+    upper bound for them. Iterations on coarse grids and accelerated
+    iterations are counted by their cost (see
+    richardson_lucy.equivalent_iterations).
+    """
+    parameters = _get_parameters(parameters)
+    num_strengths = len(parameters["regularizer_widths"])
+    deconvolution = richardson_lucy.equivalent_iterations(
+        parameters["iterations"],
+        parameters["coarse_levels"],
+        parameters["acceleration"],
+    )
+    cv_iterations = (num_strengths * parameters["cv_fold"] + 1) * deconvolution
+    return cv_iterations + num_additional * deconvolution
+
+
+def _get_parameters(overrides):
+    parameters = dict(SCHLAPPA_PARAMETERS, **overrides)
+    # TOML has no integer exponent notation, so e.g. 1e5 arrives as a float
+    parameters["iterations"] = int(parameters["iterations"])
+    return parameters
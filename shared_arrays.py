@@ -0,0 +1,43 @@
+"""
+Pass large arrays to and from joblib workers through memory mapped files.
+
+Arrays live as .npy files in a temporary folder (on /dev/shm when available, so
+they stay in shared memory). Only the file name, the "handle", crosses process
+boundaries; each process opens the array with np.load(mmap_mode=...).
+"""
+
+import contextlib
+import os
+import shutil
+import tempfile
+import numpy as np
+
+SHARED_MEMORY_DIR = "/dev/shm"
+
+
+@contextlib.contextmanager
+def shared_folder():
+    """Temporary folder for shared arrays, removed with its arrays on exit
+    """
+    parent = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None
+    folder = tempfile.mkdtemp(prefix="pax_", dir=parent)
+    try:
+        yield folder
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def create(folder, name, shape, dtype=float):
+    """Allocate a zero-filled shared array and return its handle
+    """
+    handle = os.path.join(folder, name + ".npy")
+    array = np.lib.format.open_memmap(handle, mode="w+", dtype=dtype, shape=shape)
+    del array
+    return handle
+
+
+def attach(handle, writeable=False):
+    """Return a memory mapped view of a shared array
+    """
+    mode = "r+" if writeable else "r"
+    return np.load(handle, mmap_mode=mode)
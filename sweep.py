@@ -0,0 +1,74 @@
+"""
+Run sweeps of independent simulation units, streaming results to disk.
+
+A unit is a dictionary of keyword arguments for the function run by the sweep.
+Each finished unit is saved immediately to a ResultStore under a key derived
+from its arguments, and units already in the store are skipped, so a sweep
+that stops partway can be restarted without losing finished work.
+"""
+
+import os
+import pickle
+import re
+import tempfile
+from joblib import Parallel, delayed
+
+
+class ResultStore:
+    """Directory of pickled results with one file per unit key
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __contains__(self, key):
+        return os.path.exists(self._get_filename(key))
+
+    def keys(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            file_name[: -len(".pickle")]
+            for file_name in os.listdir(self.directory)
+            if file_name.endswith(".pickle")
+        )
+
+    def save(self, key, result):
+        """Save a result, replacing the file atomically so it is never seen half written
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        handle, temp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as f:
+            pickle.dump(result, f)
+        os.replace(temp_name, self._get_filename(key))
+
+    def load(self, key):
+        with open(self._get_filename(key), "rb") as f:
+            return pickle.load(f)
+
+    def _get_filename(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+
+def unit_key(unit):
+    """Return a file name friendly key identifying a unit by its arguments
+    """
+    key = "_".join(f"{name}={unit[name]}" for name in sorted(unit))
+    return re.sub(r"[^\w.=+-]", "", key)
+
+
+def run_sweep(function, units, store, n_jobs=-1):
+    """Run function(**unit) for all units not in store yet, saving results as they complete
+    """
+    pending = [unit for unit in units if unit_key(unit) not in store]
+    print(f"Running {len(pending)} of {len(units)} units")
+    results = Parallel(n_jobs=n_jobs, return_as="generator_unordered")(
+        delayed(_run_unit)(function, unit) for unit in pending
+    )
+    for key, result in results:
+        store.save(key, result)
+        print(f"Completed {key}")
+
+
+def _run_unit(function, unit):
+    return unit_key(unit), function(**unit)
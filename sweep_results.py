@@ -0,0 +1,160 @@
+"""
+Single-file container of sweep results, indexed by level (e.g. log10 of counts).
+
+The container is an .npz (zip) file. For each level it holds "shared" arrays,
+written once, and "row" arrays whose first axis runs over replicates (or
+bootstraps). Reading a level only reads that level's entries. Row arrays
+appended in several chunks are concatenated when read.
+
+Levels are written concurrently by the workers of a sweep, so every write
+takes an exclusive lock on file_name + ".lock", copies the entries it keeps to
+a temporary file next to file_name, adds its own and moves the temporary file
+into place with os.replace. Writers never lose each other's levels and readers,
+which take no lock, always open a complete file.
+"""
+
+import contextlib
+import fcntl
+import os
+import re
+import tempfile
+import zipfile
+import numpy as np
+
+_SHARED = "shared"
+_ROWS = "rows"
+# entry names: <level>/shared/<name>.npy and <level>/rows/<name>/<chunk>.npy
+_ENTRY = re.compile(
+    r"(?P<level>[^/]+)/(?P<kind>shared|rows)/(?P<name>[^/]+?)(/(?P<chunk>\d+))?\.npy"
+)
+
+
+class SweepResults:
+    """Results of a sweep, stored in file_name
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def levels(self):
+        return sorted({float(entry["level"]) for entry in self._entries()})
+
+    def __contains__(self, level):
+        return level in self.levels()
+
+    def append(self, level, rows=None, shared=None):
+        """Append rows (and shared arrays not stored yet) to a level
+
+        rows and shared map names to arrays. Rows are added after the rows
+        already stored for the level.
+        """
+        with self._lock():
+            level_entries = [i for i in self._entries() if float(i["level"]) == level]
+            stored_shared = {i["name"] for i in level_entries if i["kind"] == _SHARED}
+            next_chunk = 1 + max(
+                [int(i["chunk"]) for i in level_entries if i["kind"] == _ROWS] + [-1]
+            )
+            self._rewrite(
+                None,
+                level,
+                rows,
+                {
+                    name: array
+                    for name, array in (shared or {}).items()
+                    if name not in stored_shared
+                },
+                next_chunk,
+            )
+
+    def write(self, level, rows, shared):
+        """Write a level, replacing what is stored for it in one step
+        """
+        with self._lock():
+            self._rewrite(level, level, rows, shared, 0)
+
+    def remove(self, level):
+        """Remove a level, rewriting the file without it
+        """
+        with self._lock():
+            if os.path.exists(self.file_name):
+                self._rewrite(level, level, {}, {}, 0)
+
+    def __getitem__(self, level):
+        """Return the shared arrays and the concatenated rows of a level
+        """
+        shared = {}
+        chunks = {}
+        if not os.path.exists(self.file_name):
+            raise KeyError(level)
+        with zipfile.ZipFile(self.file_name) as archive:
+            for info in archive.infolist():
+                entry = _ENTRY.fullmatch(info.filename)
+                if float(entry["level"]) != level:
+                    continue
+                with archive.open(info) as f:
+                    array = np.lib.format.read_array(f)
+                if entry["kind"] == _SHARED:
+                    shared[entry["name"]] = array
+                else:
+                    chunks.setdefault(entry["name"], []).append(
+                        (int(entry["chunk"]), array)
+                    )
+        if not shared and not chunks:
+            raise KeyError(level)
+        rows = {
+            name: np.concatenate([array for _, array in sorted(name_chunks)])
+            for name, name_chunks in chunks.items()
+        }
+        return shared, rows
+
+    def _entries(self):
+        if not os.path.exists(self.file_name):
+            return
+        with zipfile.ZipFile(self.file_name) as archive:
+            for name in archive.namelist():
+                yield _ENTRY.fullmatch(name)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_name)), exist_ok=True)
+        with open(self.file_name + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _rewrite(self, dropped_level, level, rows, shared, chunk):
+        """Replace the file with its entries not of dropped_level and new ones
+
+        Must be called holding the lock.
+        """
+        handle, temp_name = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.file_name)), suffix=".tmp"
+        )
+        os.close(handle)
+        try:
+            with zipfile.ZipFile(temp_name, mode="w") as destination:
+                if os.path.exists(self.file_name):
+                    with zipfile.ZipFile(self.file_name) as source:
+                        for info in source.infolist():
+                            entry = _ENTRY.fullmatch(info.filename)
+                            if float(entry["level"]) != dropped_level:
+                                destination.writestr(info, source.read(info))
+                for name, array in (shared or {}).items():
+                    _write(destination, f"{float(level)!r}/{_SHARED}/{name}.npy", array)
+                for name, array in (rows or {}).items():
+                    _write(
+                        destination,
+                        f"{float(level)!r}/{_ROWS}/{name}/{chunk}.npy",
+                        array,
+                    )
+            os.replace(temp_name, self.file_name)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+
+
+def _write(archive, entry_name, array):
+    with archive.open(entry_name, mode="w", force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
@@ -0,0 +1,174 @@
+"""
+Declarative sweep definitions, loaded from TOML files in sweeps/.
+
+A sweep spec names the function to run for each unit, the axes whose Cartesian
+product gives the units and the fixed arguments shared by all units, e.g.
+
+    name = "doublet2"
+    function = "run_simulations.doublet2:run_set"
+    cost = "run_simulations.doublet2:estimate_iterations"
+    results_dir = "simulated_results/sweeps/doublet2"
+
+    [axes]
+    separation = [0.025, 0.045, 0.07]
+    log10_counts = [4.0, 5.0, 6.0]
+
+    [fixed]
+    iterations = 1e5
+
+Units already in the sweep's ResultStore are skipped, so extending an axis only
+runs the new points. Run with
+
+    python -m sweep_spec sweeps/doublet2.toml [--estimate] [--enqueue QUEUE_DIR]
+"""
+
+import argparse
+import dataclasses
+import importlib
+import itertools
+import os
+from typing import Optional
+
+try:
+    import tomllib
+except ImportError:
+    # Python < 3.11
+    import tomli as tomllib
+
+import sweep
+import work_queue
+
+
+@dataclasses.dataclass
+class SweepSpec:
+    """Definition of a sweep
+
+    function and cost are "module:function" names. cost(**unit) returns the
+    cost of a unit in standard LR iterations, which seconds_per_iteration
+    converts to an estimated run time. results_dir is relative to the repository.
+    """
+
+    name: str
+    function: str
+    results_dir: str
+    axes: dict
+    fixed: dict = dataclasses.field(default_factory=dict)
+    cost: Optional[str] = None
+    seconds_per_iteration: Optional[float] = None
+
+
+def load(file_name):
+    """Load a SweepSpec from a TOML file
+    """
+    with open(file_name, "rb") as f:
+        return SweepSpec(**tomllib.load(f))
+
+
+def expand(spec):
+    """Return the units of a sweep, one per point of the Cartesian product of its axes
+
+    Points repeated in the axes give a single unit. If the module of the
+    function has a FILE_NAME_PARAMETERS list, the arguments that the names of
+    the function's output files encode, a ValueError is raised for axes over
+    other arguments, whose units would overwrite each other's outputs.
+    """
+    module_name, _ = spec.function.split(":")
+    encoded = getattr(
+        importlib.import_module(module_name), "FILE_NAME_PARAMETERS", None
+    )
+    if encoded is not None:
+        unencoded = [name for name in spec.axes if name not in encoded]
+        if unencoded:
+            raise ValueError(
+                f"{spec.name} sweeps {unencoded}, which the output file names of "
+                f"{spec.function} do not encode (only {encoded}), so its units "
+                "would overwrite each other"
+            )
+    names = list(spec.axes)
+    units = {}
+    for values in itertools.product(*(spec.axes[name] for name in names)):
+        unit = dict(spec.fixed)
+        unit.update(zip(names, values))
+        units.setdefault(sweep.unit_key(unit), unit)
+    return list(units.values())
+
+
+def get_store(spec):
+    return sweep.ResultStore(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), spec.results_dir)
+    )
+
+
+def pending_units(spec):
+    """Return the units of a sweep that are not in its result store yet
+    """
+    store = get_store(spec)
+    return [unit for unit in expand(spec) if sweep.unit_key(unit) not in store]
+
+
+def estimate_cost(spec):
+    """Return the numbers of units and pending units, and the cost of the pending units
+
+    The cost is in standard LR iterations and, if the spec has
+    seconds_per_iteration, in hours. Both are None if the spec has no cost function.
+    """
+    units = expand(spec)
+    pending = pending_units(spec)
+    estimate = {
+        "units": len(units),
+        "pending_units": len(pending),
+        "iterations": None,
+        "hours": None,
+    }
+    if spec.cost is not None:
+        cost = _import_function(spec.cost)
+        estimate["iterations"] = sum(cost(**unit) for unit in pending)
+        if spec.seconds_per_iteration is not None:
+            estimate["hours"] = (
+                estimate["iterations"] * spec.seconds_per_iteration / 3600
+            )
+    return estimate
+
+
+def run(spec, n_jobs=-1):
+    """Run the pending units of a sweep on this machine
+    """
+    sweep.run_sweep(
+        _import_function(spec.function), pending_units(spec), get_store(spec), n_jobs
+    )
+
+
+def enqueue(spec, queue_dir):
+    """Queue the pending units of a sweep for work_queue workers
+    """
+    work_queue.enqueue(
+        _import_function(spec.function), pending_units(spec), get_store(spec), queue_dir
+    )
+
+
+def _import_function(name):
+    module_name, function_name = name.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a sweep defined in a TOML file")
+    parser.add_argument("spec_file")
+    parser.add_argument(
+        "--estimate", action="store_true", help="only print the cost estimate"
+    )
+    parser.add_argument("--enqueue", metavar="QUEUE_DIR", default=None)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    args = parser.parse_args()
+    spec = load(args.spec_file)
+    print(f"{spec.name}: {estimate_cost(spec)}")
+    if args.estimate:
+        return
+    if args.enqueue is not None:
+        enqueue(spec, args.enqueue)
+    else:
+        run(spec, args.n_jobs)
+
+
+if __name__ == "__main__":
+    main()
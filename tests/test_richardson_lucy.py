@@ -0,0 +1,133 @@
+"""Tests of richardson_lucy's LR Fister deconvolution
+
+Run from the repository root with
+
+    python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+from scipy.ndimage import convolve1d
+
+pytest.importorskip("pax_deconvolve")
+import richardson_lucy
+
+ENERGY_SPACING = 0.02
+REGULARIZATION_STRENGTH = 0.02
+ITERATIONS = 300
+_IMPULSE_RESPONSE_X = np.arange(-2, 2, ENERGY_SPACING)
+IMPULSE_RESPONSES = {
+    "lorentzian": 1 / (1 + (_IMPULSE_RESPONSE_X / 0.2) ** 2),
+    # vanishing tails, which only constrain the edges of the deconvolution
+    "fermi_edge": np.exp(-((_IMPULSE_RESPONSE_X + 0.5) ** 2) / 0.5)
+    / (1 + np.exp((_IMPULSE_RESPONSE_X - 0.5) / 0.03)),
+}
+# largest difference from the direct sums, relative to the max of the result
+FLOAT64_TOLERANCE = {"lorentzian": 1e-10, "fermi_edge": 1e-5}
+FLOAT32_TOLERANCE = 1e-3
+# largest difference from pax_deconvolve's deconvolver, which the manuscript
+# uses, relative to its max
+PAX_DECONVOLVE_TOLERANCE = 1e-5
+
+
+def _measured_y(impulse_response_y, spectra=None):
+    """Return a simulated spectrum, or spectra rows of them
+    """
+    x = np.arange(-4, 5, ENERGY_SPACING)
+    xray_y = np.exp(-((x - 1) ** 2) / 0.02) + 0.5 * np.exp(-((x + 2) ** 2) / 0.1) + 0.2
+    expected_y = np.convolve(xray_y, impulse_response_y, mode="valid")
+    shape = None if spectra is None else (spectra, len(expected_y))
+    return np.random.default_rng(0).poisson(1e4 * expected_y, shape) / 1e4
+
+
+def _direct_lr_fister(measured_y, impulse_response_y, iterations):
+    """Return the float64 LR Fister deconvolution, with every convolution a direct sum
+    """
+    flipped = impulse_response_y[::-1]
+    normalization = np.convolve(np.ones(len(measured_y)), flipped)
+    smoothing_kernel = richardson_lucy.gaussian_kernel(
+        REGULARIZATION_STRENGTH / ENERGY_SPACING
+    )
+    estimate = richardson_lucy.flat_estimate(measured_y, impulse_response_y)
+    for _ in range(iterations):
+        reconstruction = np.convolve(estimate, impulse_response_y, mode="valid")
+        ratio = measured_y / reconstruction
+        estimate = estimate * (np.convolve(ratio, flipped) / normalization)
+        estimate = convolve1d(estimate, smoothing_kernel, mode="constant")
+    return estimate
+
+
+def _lr_fister(measured_y, impulse_response_y, dtype=np.float64):
+    return richardson_lucy.lr_fister(
+        measured_y.astype(dtype),
+        impulse_response_y.astype(dtype),
+        REGULARIZATION_STRENGTH,
+        ENERGY_SPACING,
+        ITERATIONS,
+    )
+
+
+@pytest.mark.parametrize("name", IMPULSE_RESPONSES)
+def test_float64_updates_every_point_as_direct_sums(name):
+    impulse_response_y = IMPULSE_RESPONSES[name] / np.sum(IMPULSE_RESPONSES[name])
+    measured_y = _measured_y(impulse_response_y)
+    expected = _direct_lr_fister(measured_y, impulse_response_y, ITERATIONS)
+    deconvolved_y = _lr_fister(measured_y, impulse_response_y)
+    assert deconvolved_y.dtype == np.float64
+    assert np.amax(np.abs(deconvolved_y - expected)) <= FLOAT64_TOLERANCE[
+        name
+    ] * np.amax(expected)
+
+
+@pytest.mark.parametrize("name", IMPULSE_RESPONSES)
+def test_matches_pax_deconvolve(name):
+    from pax_deconvolve.deconvolution import deconvolvers
+
+    impulse_response_y = IMPULSE_RESPONSES[name] / np.sum(IMPULSE_RESPONSES[name])
+    pax_spectra_y = _measured_y(impulse_response_y, spectra=10)
+    convolved_x = ENERGY_SPACING * np.arange(pax_spectra_y.shape[1])
+    fitted = [
+        deconvolver_class(
+            _IMPULSE_RESPONSE_X,
+            impulse_response_y,
+            convolved_x,
+            regularization_strength=REGULARIZATION_STRENGTH,
+            iterations=ITERATIONS,
+        ).fit(pax_spectra_y)
+        for deconvolver_class in [
+            deconvolvers.LRFisterDeconvolve,
+            richardson_lucy.LRFisterDeconvolve,
+        ]
+    ]
+    expected, deconvolver = fitted
+    for attribute in ["deconvolved_y_", "reconstruction_y_"]:
+        expected_y = getattr(expected, attribute)
+        difference = np.amax(np.abs(getattr(deconvolver, attribute) - expected_y))
+        assert difference <= PAX_DECONVOLVE_TOLERANCE * np.amax(expected_y)
+
+
+@pytest.mark.parametrize("name", IMPULSE_RESPONSES)
+def test_float32_agrees_with_float64(name):
+    impulse_response_y = IMPULSE_RESPONSES[name] / np.sum(IMPULSE_RESPONSES[name])
+    measured_y = _measured_y(impulse_response_y)
+    expected = _lr_fister(measured_y, impulse_response_y)
+    deconvolved_y = _lr_fister(measured_y, impulse_response_y, np.float32)
+    assert deconvolved_y.dtype == np.float32
+    assert np.amax(np.abs(deconvolved_y - expected)) <= FLOAT32_TOLERANCE * np.amax(
+        expected
+    )
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_adjoint_matches_direct_sums(dtype):
+    impulse_response_y = IMPULSE_RESPONSES["fermi_edge"]
+    convolved_y = np.random.default_rng(0).random((2, 300)) + 0.5
+    operator = richardson_lucy.ConvolutionOperator(impulse_response_y, 300, dtype=dtype)
+    expected = np.array(
+        [np.convolve(row, impulse_response_y[::-1]) for row in convolved_y]
+    )
+    adjoint_y = operator.adjoint(convolved_y.astype(dtype))
+    assert adjoint_y.dtype == dtype
+    # every point, down to the vanishing edges, to within a relative tolerance
+    tolerance = 1e-6 if dtype == np.float64 else 1e-3
+    assert np.all(np.abs(adjoint_y - expected) <= tolerance * expected)
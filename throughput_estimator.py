@@ -0,0 +1,116 @@
+"""
+Estimate PAX data quality from photon flux, converter and acquisition time.
+
+Photon flux is turned into detected electrons with the converter's conversion
+efficiency, and data quality is interpolated from RMSE and FWHM versus
+detected electrons curves precomputed from stored pipeline results. No
+deconvolutions are run, and all inputs are broadcast against each other, so
+large numbers of what-if queries can be answered with a few NumPy calls.
+"""
+
+import functools
+import os
+import numpy as np
+
+import pax_simulation_pipeline
+from manuscript_plots import schlappa_performance, schlappa_performance_quant
+from manuscript_plots.conversion_efficiency import conversion_efficiency_plot
+
+
+def build_quality_table(
+    log10_counts_list=schlappa_performance.LOG10_COUNTS_LIST,
+    rixs="schlappa",
+    photoemission="ag",
+):
+    """Compute and save data quality versus detected electrons from stored pipeline results
+    """
+    log10_counts = np.sort(log10_counts_list)
+    norm_rmse = []
+    fwhm = []
+    # a first loss peak is not reliably retrieved at the lowest counts
+    too_low = log10_counts[: -schlappa_performance_quant.TOO_LOW]
+    data_list = pax_simulation_pipeline.load_sweep_summaries(
+        log10_counts, rixs, photoemission
+    )
+    for log10_num_electrons, data in zip(log10_counts, data_list):
+        norm_rmse.append(schlappa_performance_quant.get_norm_rmse(data))
+        if log10_num_electrons in too_low:
+            fwhm.append(np.nan)
+        else:
+            fwhm.append(schlappa_performance_quant.get_median_fwhm(data))
+    np.savez(
+        _get_table_filename(rixs, photoemission),
+        log10_counts=log10_counts,
+        norm_rmse=np.array(norm_rmse),
+        fwhm=np.array(fwhm),
+    )
+    load_quality_table.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def load_quality_table(rixs="schlappa", photoemission="ag"):
+    """Load data quality versus detected electrons saved by build_quality_table
+    """
+    with np.load(_get_table_filename(rixs, photoemission)) as data:
+        return {name: data[name] for name in data.files}
+
+
+def detected_electrons(
+    photon_flux,
+    acquisition_time,
+    photon_energy,
+    converter="Ag 3d",
+    detection_efficiency=1.0,
+):
+    """Return expected number of detected electrons
+
+    photon_flux is in photons per second on the converter, acquisition_time in
+    seconds and photon_energy in eV. detection_efficiency is the fraction of
+    emitted photoelectrons that are detected by the spectrometer.
+    """
+    conversion_efficiency = conversion_efficiency_plot.conversion_efficiency_map(
+        photon_energy, [converter]
+    )[0]
+    return photon_flux * acquisition_time * conversion_efficiency * detection_efficiency
+
+
+def estimate_quality(
+    photon_flux,
+    acquisition_time,
+    photon_energy=778.0,
+    converter="Ag 3d",
+    detection_efficiency=1.0,
+    rixs="schlappa",
+    photoemission="ag",
+):
+    """Return predicted detected electrons and data quality of PAX measurements
+
+    Quality is interpolated (in log of detected electrons) from the stored
+    simulations with the given rixs and photoemission models: "norm_rmse" is
+    the RMSE of the deconvolved spectrum normalized by the maximum of the
+    ground truth and "fwhm" the FWHM of the first loss peak in eV. Both are NaN
+    outside the range of simulated detected electrons.
+    """
+    num_electrons = detected_electrons(
+        photon_flux, acquisition_time, photon_energy, converter, detection_efficiency
+    )
+    table = load_quality_table(rixs, photoemission)
+    with np.errstate(divide="ignore"):
+        log10_num_electrons = np.log10(num_electrons)
+    quality = {"detected_electrons": num_electrons}
+    for name in ["norm_rmse", "fwhm"]:
+        quality[name] = np.interp(
+            log10_num_electrons,
+            table["log10_counts"],
+            table[name],
+            left=np.nan,
+            right=np.nan,
+        )
+    return quality
+
+
+def _get_table_filename(rixs, photoemission):
+    return os.path.join(
+        pax_simulation_pipeline.PROCESSED_DATA_DIR,
+        f"{photoemission}_{rixs}_quality_vs_counts.npz",
+    )
@@ -0,0 +1,172 @@
+"""
+Run sweeps on any number of processes and nodes through a work queue on a shared file system.
+
+enqueue writes one file per sweep unit to the queue folder. Workers, started
+with work() or `python -m work_queue QUEUE_DIR` on any node that sees the
+folder, claim units by creating a claim file with O_CREAT | O_EXCL, which only
+one process can succeed at, so no locks or external services are needed.
+Results are saved to the sweep's ResultStore, and a worker exits when no
+unclaimed units are left. Units that write further output files (e.g. the
+pickles of pax_simulation_pipeline and doublet2) write them under the
+simulated_results folder of the checkout the worker imports them from, by
+absolute path, so workers should run from a checkout on the shared file
+system. A unit whose function raises gets a file with the
+traceback in failed/ and is not retried until retry_failed is called, and
+claims of crashed workers can be released with release_stale_claims.
+"""
+
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import time
+import traceback
+
+import sweep
+
+_UNITS = "units"
+_CLAIMS = "claims"
+_FAILED = "failed"
+
+
+def enqueue(function, units, store, queue_dir):
+    """Add units of function to the queue, skipping units already in the store
+
+    function must be importable by the workers, i.e. defined at the top level
+    of a module, and store must be on a file system the workers share.
+    """
+    os.makedirs(os.path.join(queue_dir, _UNITS), exist_ok=True)
+    num_queued = 0
+    for unit in units:
+        key = sweep.unit_key(unit)
+        if key in store:
+            continue
+        file_name = os.path.join(queue_dir, _UNITS, key + ".pickle")
+        temp_name = file_name + ".tmp"
+        with open(temp_name, "wb") as f:
+            pickle.dump({"function": function, "unit": unit, "store": store}, f)
+        os.replace(temp_name, file_name)
+        num_queued += 1
+    print(f"Queued {num_queued} of {len(units)} units")
+
+
+def work(queue_dir):
+    """Claim and run queued units until none are left, returning the number run
+    """
+    num_run = 0
+    while True:
+        key = _claim_next(queue_dir)
+        if key is None:
+            return num_run
+        with open(os.path.join(queue_dir, _UNITS, key + ".pickle"), "rb") as f:
+            task = pickle.load(f)
+        try:
+            result = task["function"](**task["unit"])
+        except Exception:
+            _write_text(os.path.join(queue_dir, _FAILED, key), traceback.format_exc())
+            print(f"Failed {key}")
+        else:
+            task["store"].save(key, result)
+            print(f"Completed {key}")
+        num_run += 1
+
+
+def run_local(queue_dir, num_workers):
+    """Run num_workers worker processes on this machine and wait for them to finish
+    """
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "work_queue", os.path.abspath(queue_dir)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        for _ in range(num_workers)
+    ]
+    return [worker.wait() for worker in workers]
+
+
+def status(queue_dir):
+    """Return the numbers of queued units that are done, running, failed and pending
+    """
+    counts = {"done": 0, "running": 0, "failed": 0, "pending": 0}
+    for key in _get_keys(queue_dir):
+        if os.path.exists(os.path.join(queue_dir, _FAILED, key)):
+            counts["failed"] += 1
+        elif not os.path.exists(os.path.join(queue_dir, _CLAIMS, key)):
+            counts["pending"] += 1
+        elif key in _load_store(queue_dir, key):
+            counts["done"] += 1
+        else:
+            counts["running"] += 1
+    return counts
+
+
+def release_stale_claims(queue_dir, max_age):
+    """Remove claims older than max_age seconds of units that did not finish or fail
+
+    Use this to requeue units of crashed workers. max_age must be longer than
+    the longest unit takes, or running units will be run twice.
+    """
+    now = time.time()
+    for key in _get_keys(queue_dir):
+        claim = os.path.join(queue_dir, _CLAIMS, key)
+        if (
+            os.path.exists(claim)
+            and now - os.path.getmtime(claim) > max_age
+            and not os.path.exists(os.path.join(queue_dir, _FAILED, key))
+            and key not in _load_store(queue_dir, key)
+        ):
+            os.remove(claim)
+            print(f"Released {key}")
+
+
+def retry_failed(queue_dir):
+    """Requeue units whose function raised
+    """
+    for key in _get_keys(queue_dir):
+        failed = os.path.join(queue_dir, _FAILED, key)
+        if os.path.exists(failed):
+            os.remove(os.path.join(queue_dir, _CLAIMS, key))
+            os.remove(failed)
+
+
+def _claim_next(queue_dir):
+    """Claim the first unclaimed unit and return its key, or None if there is none
+    """
+    os.makedirs(os.path.join(queue_dir, _CLAIMS), exist_ok=True)
+    for key in _get_keys(queue_dir):
+        claim = os.path.join(queue_dir, _CLAIMS, key)
+        try:
+            handle = os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        with os.fdopen(handle, "w") as f:
+            f.write(f"{socket.gethostname()} {os.getpid()}\n")
+        return key
+    return None
+
+
+def _get_keys(queue_dir):
+    units_dir = os.path.join(queue_dir, _UNITS)
+    if not os.path.isdir(units_dir):
+        return []
+    return sorted(
+        file_name[: -len(".pickle")]
+        for file_name in os.listdir(units_dir)
+        if file_name.endswith(".pickle")
+    )
+
+
+def _load_store(queue_dir, key):
+    with open(os.path.join(queue_dir, _UNITS, key + ".pickle"), "rb") as f:
+        return pickle.load(f)["store"]
+
+
+def _write_text(file_name, text):
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(file_name, "w") as f:
+        f.write(text)
+
+
+if __name__ == "__main__":
+    print(f"Ran {work(sys.argv[1])} units")